@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+# Shared by the map and chart scripts: a JSON file mapping each output target to
+# the hash of its data slice and rendering parameters. Targets whose hash and
+# output files are unchanged are skipped on the next run.
+
+MANIFEST_VERSION = 1
+
+def load_manifest(path):
+    """Loads a build manifest, or returns an empty one if missing/unreadable/outdated."""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (OSError, json.JSONDecodeError):
+            print(f"Warning: could not read build manifest '{path}', rebuilding everything.")
+    return {'version': MANIFEST_VERSION, 'targets': {}}
+
+def save_manifest(manifest, path):
+    """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def frame_digest(df):
+    """Content hash of a DataFrame's values (index ignored)."""
+    if df is None or len(df) == 0:
+        return hashlib.sha256(b'empty').hexdigest()
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    h = hashlib.sha256(row_hashes.tobytes())
+    h.update(','.join(map(str, df.columns)).encode('utf-8'))
+    return h.hexdigest()
+
+def file_sha256(path):
+    """SHA-256 of a file's bytes, read in 1 MB chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def params_digest(*parts):
+    """Hash of JSON-serializable rendering parameters (tuples, numbers, strings...)."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def is_up_to_date(manifest, target, digest, outputs):
+    """True if target was last built from the same digest and all its outputs still exist."""
+    if manifest['targets'].get(target) != digest:
+        return False
+    return all(os.path.exists(path) for path in outputs)
+
+def record_target(manifest, target, digest):
+    manifest['targets'][target] = digest
+
+def group_digests(df, keys):
+    """Content hash of every group of df in one pass: {group key: digest}."""
+    if len(df) == 0:
+        return {}
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return {
+        key: hashlib.sha256(row_hashes[idx].tobytes()).hexdigest()
+        for key, idx in df.groupby(keys, observed=True, sort=False).indices.items()
+    }
@@ -1,23 +1,43 @@
 import json
 import csv
 import os
+import hashlib
+import argparse
+
+try:
+    import shapely
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+except ImportError:
+    shapely = None
 
 # Configuration
 input_filename = 'Viet Nam_tinh thanh.geojson'
 output_filename = 'vietnam_provinces.csv'
+geometry_cache_filename = 'vietnam_provinces_geometry.json'
 
-def extract_to_csv():
+# Simplification tolerances (in degrees) written to the geometry cache.
+# 0.001 deg is roughly 1/3 px on the 5000 px map, so it is visually lossless there.
+simplify_tolerances = [0.001, 0.005, 0.02]
+
+def load_geojson():
+    """Parsed GeoJSON, or None (with a message) if the file is missing or malformed."""
     # Check if file exists
     if not os.path.exists(input_filename):
         print(f"Error: The file '{input_filename}' was not found.")
-        return
+        return None
 
     print("Reading GeoJSON file...")
     try:
         with open(input_filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+            return json.load(f)
     except json.JSONDecodeError:
         print("Error: Failed to decode JSON. Please check the file format.")
+        return None
+
+def extract_to_csv():
+    data = load_geojson()
+    if data is None:
         return
 
     # List to hold unique records
@@ -63,5 +83,78 @@ def extract_to_csv():
 
     print(f"Done! Data saved to '{output_filename}'.")
 
+def build_geometry_cache():
+    """Builds only the geometry cache; vietnam_provinces.csv is not touched."""
+    data = load_geojson()
+    if data is not None:
+        extract_geometry_cache(data)
+
+def extract_geometry_cache(data):
+    """
+    Writes simplified province geometries (one per tolerance), label anchor points
+    and bounding boxes to a compact JSON cache used by the map renderer.
+    """
+    if shapely is None:
+        print("Skipping geometry cache: shapely is not installed.")
+        return
+
+    print("Building geometry cache...")
+
+    # Merge split geometries so each province has exactly one shape
+    parts = {}
+    names = {}
+    for feature in data.get('features', []):
+        props = feature.get('properties', {})
+        ma_tinh = props.get('ma_tinh')
+        if not ma_tinh or not feature.get('geometry'):
+            continue
+        parts.setdefault(ma_tinh, []).append(shape(feature['geometry']))
+        names.setdefault(ma_tinh, props.get('ten_tinh'))
+
+    provinces = []
+    full_shapes = []
+    for ma_tinh, geoms in parts.items():
+        full = geoms[0] if len(geoms) == 1 else unary_union(geoms)
+        full_shapes.append(full)
+        # Anchors come from the full-resolution shape so labels don't move between tolerances
+        anchor = full.representative_point()
+        provinces.append({
+            'ma_tinh': ma_tinh,
+            'ten_tinh': names[ma_tinh],
+            'label_x': round(anchor.x, 6),
+            'label_y': round(anchor.y, 6),
+            'bbox': [round(v, 6) for v in full.bounds]
+        })
+
+    # Simplify all provinces together as one coverage, so neighbours keep sharing the same
+    # simplified border (simplifying each shape on its own opens gaps and overlaps between them)
+    geometries = {}
+    for tol in simplify_tolerances:
+        simple = shapely.coverage_simplify(full_shapes, tol)
+        geometries[str(tol)] = list(shapely.to_wkb(simple, hex=True, output_dimension=2))
+
+    with open(input_filename, 'rb') as f:
+        source_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    cache = {
+        'source_sha256': source_sha256,
+        'crs': data.get('crs', {}).get('properties', {}).get('name', 'EPSG:4326'),
+        'tolerances': simplify_tolerances,
+        'provinces': provinces,
+        'geometries': geometries
+    }
+
+    with open(geometry_cache_filename, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, separators=(',', ':'))
+
+    print(f"Done! Geometry cache for {len(provinces)} provinces saved to '{geometry_cache_filename}'.")
+
 if __name__ == "__main__":
-    extract_to_csv()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract province data from the GeoJSON.")
+    parser.add_argument('--geometry-cache', action='store_true',
+                        help=f"Only build '{geometry_cache_filename}' (leaves '{output_filename}' untouched).")
+    args = parser.parse_args()
+    if args.geometry_cache:
+        build_geometry_cache()
+    else:
+        extract_to_csv()
\ No newline at end of file
@@ -4,9 +4,31 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import matplotlib.patheffects as pe
 from matplotlib.table import Table
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection, PolyCollection, LineCollection
+from matplotlib.textpath import TextPath
+from matplotlib.font_manager import FontProperties
+from matplotlib.transforms import Affine2D
 import numpy as np
+from PIL import Image
 import os
+import io
+import math
+import shutil
+import tempfile
+import time
+import hashlib
+import json
+import sys
+import argparse
+import traceback
 import textwrap 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from score_schema import SCORE_SCHEMA_VERSION, apply_score_schema, normalize_province_codes
+from build_manifest import (load_manifest, save_manifest, file_sha256, frame_digest, params_digest, group_digests,
+                            is_up_to_date, record_target)
+from workbook_cache import cached_frame
 
 # ==========================================
 # 1. CONFIGURATION & MAPPINGS
@@ -14,10 +36,46 @@ import textwrap
 
 # File Paths
 GEOJSON_PATH = 'Viet Nam_tinh thanh.geojson'
+GEOMETRY_CACHE_PATH = 'vietnam_provinces_geometry.json'  # Written by extract_geojson.py --geometry-cache
 PROVINCES_CSV_PATH = 'vietnam_provinces.csv'
 AVG_SCORES_CSV_PATH = 'average_scores_2016_2025.csv'
 DIST_SCORES_CSV_PATH = 'score_distribution_provinces_2016_2025.csv'
 OUTPUT_DIR = 'output_maps'
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, 'build_manifest.json')
+CACHE_DIR = 'cache'
+
+# Default fraction clipped from each end when deriving color limits (0.0 = plain min/max, --color-clip)
+COLOR_LIMIT_CLIP = 0.0
+COLOR_LIMITS_CACHE_NAME = 'subject_color_limits.json'
+
+# Figure constants (also part of each map's build hash)
+MAP_FIGSIZE = (50, 50)
+MAP_DPI = 100
+# Bump when the drawing code changes so every map is re-rendered once
+MAP_RENDER_VERSION = 1
+
+# Resolution pyramid written next to each full-size map when requested (--pyramid)
+PYRAMID_MEDIUM_SIZE = 2048
+PYRAMID_THUMB_SIZE = 512
+PYRAMID_TILE_SIZE = 256
+
+# Detail table renderer: 'fast' (batched collections) or 'table' (matplotlib.table.Table)
+DEFAULT_TABLE_RENDERER = 'fast'
+
+# Detail table styling, shared by both renderers
+TABLE_HEADER_HEIGHT = 0.03
+TABLE_ROW_HEIGHT = 0.022
+TABLE_HEADER_FONTSIZE = 34
+TABLE_ROW_FONTSIZE = 29
+TABLE_HEADER_COLOR = '#e0e0e0'
+TABLE_NATIONAL_COLOR = '#fff3e0'
+TABLE_ROW_COLORS = ('#ffffff', '#f9f9f9')
+
+# Rows per chunk when streaming the distribution CSV for a single map
+DIST_CHUNK_ROWS = 500_000
+
+# Simplification level read from the geometry cache (must be one of its tolerances)
+MAP_GEOMETRY_TOLERANCE = 0.001
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -41,35 +99,9 @@ SUBJECT_NAME_MAP = {
 }
 
 # Custom Min/Max Limits for Color Scaling
-SUBJECT_COLOR_LIMITS = {
-    "DiaLy": (4.16, 8.07),
-    "HoaHoc": (3.93, 7.52),
-    "KHTN": (3.88, 7.29),
-    "KhoiA": (12.2, 22.93),
-    "KhoiA02": (12.22, 22.5),
-    "KhoiA1": (11.41, 22.46),
-    "KhoiB": (12.32, 22.52),
-    "KhoiC": (12.19, 23.42),
-    "KhoiC01": (13.08, 23.46),
-    "KhoiD": (10.37, 21.71),
-    "KhoiD07": (11.49, 22.5),
-    "LichSu": (2.92, 7.44),
-    "NgoaiNgu": (2.58, 7.23),
-    "NguVan": (3.65, 8.17),
-    "SinhHoc": (3.89, 7.32),
-    "Toan": (2.99, 7.83),
-    "TongDiem": (21.03, 45.88),
-    "TongDiemKHTN": (24.26, 44.04),
-    "VatLy": (3.81, 7.5),
-    "GDCD": (5.98, 9.11),
-    "KHXH": (4.74, 8.45),
-    "TongDiemKHXH": (24.87, 46.79),
-    # NEW SUBJECTS ADDED
-    "CongNgheCongNghiep": (4.1, 8.62),
-    "CongNgheNongNghiep": (7.03, 8.5),
-    "KinhTePhapLuat": (6.82, 8.43),
-    "TinHoc": (5.23, 9.11)
-}
+# Color limits are derived from the average-score data (see compute_subject_color_limits).
+# List a subject here only to deliberately override its derived (vmin, vmax).
+SUBJECT_COLOR_LIMITS = {}
 
 # Groupings
 # Added new subjects to GROUP_MON
@@ -138,13 +170,6 @@ def get_chart_title(year, subject_code):
             
     return f"BẢN ĐỒ KẾT QUẢ THI NĂM {year} - {subject_upper}"
 
-def standardize_province_code(val):
-    try:
-        s = str(val).split('.')[0]
-        return s.zfill(2)
-    except:
-        return str(val).zfill(2)
-
 # ==========================================
 # 3. DATA PROCESSING
 # ==========================================
@@ -159,7 +184,7 @@ def clean_data_frame(df_input, year_col='Year', prov_col='Province_Code', score_
         df[year_col] = df[year_col].astype(int)
     
     if prov_col in df.columns:
-        df[prov_col] = df[prov_col].apply(standardize_province_code)
+        df[prov_col] = normalize_province_codes(df[prov_col])
     
     for col in score_cols:
         if col in df.columns:
@@ -167,14 +192,46 @@ def clean_data_frame(df_input, year_col='Year', prov_col='Province_Code', score_
             
     return df
 
+def load_cached_score_frame(csv_path, score_cols):
+    """
+    Loads a cleaned, compactly typed score CSV through a Feather cache in CACHE_DIR
+    (see workbook_cache.cached_frame), rebuilt when the CSV or the schema version changes.
+    """
+    def parse_csv():
+        raw = pd.read_csv(csv_path, dtype=str, low_memory=False, encoding='utf-8-sig')
+        df = clean_data_frame(raw, year_col='Year', prov_col='Province_Code', score_cols=score_cols)
+        return apply_score_schema(df)
+    
+    return cached_frame(csv_path, CACHE_DIR, f"v{SCORE_SCHEMA_VERSION}", parse_csv)
+
+def load_province_geometry(tolerance=MAP_GEOMETRY_TOLERANCE):
+    """
+    Returns the province GeoDataFrame, preferring the simplified geometry cache.
+    Falls back to the raw GeoJSON when the cache is missing, stale or lacks the tolerance.
+    """
+    if os.path.exists(GEOMETRY_CACHE_PATH):
+        with open(GEOMETRY_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        
+        key = str(tolerance)
+        if os.path.exists(GEOJSON_PATH) and cache.get('source_sha256') != file_sha256(GEOJSON_PATH):
+            print(f"Warning: {GEOMETRY_CACHE_PATH} is stale, re-run extract_geojson.py --geometry-cache. Using {GEOJSON_PATH}.")
+        elif key not in cache['geometries']:
+            print(f"Warning: tolerance {key} not in {GEOMETRY_CACHE_PATH}. Using {GEOJSON_PATH}.")
+        else:
+            geometry = gpd.GeoSeries.from_wkb(cache['geometries'][key], crs=cache['crs'])
+            return gpd.GeoDataFrame(pd.DataFrame(cache['provinces']), geometry=geometry)
+    
+    return gpd.read_file(GEOJSON_PATH)
+
 def load_and_prep_data():
-    gdf = gpd.read_file(GEOJSON_PATH)
+    gdf = load_province_geometry()
     
     df_prov = pd.read_csv(PROVINCES_CSV_PATH, dtype=str, keep_default_na=False, encoding='utf-8-sig')
     df_prov.columns = df_prov.columns.str.strip()
     
-    df_prov['ma_tinh'] = df_prov['ma_tinh'].apply(standardize_province_code)
-    df_prov['Province_Code'] = df_prov['Province_Code'].apply(standardize_province_code)
+    df_prov['ma_tinh'] = normalize_province_codes(df_prov['ma_tinh'])
+    df_prov['Province_Code'] = normalize_province_codes(df_prov['Province_Code'])
     
     cols_to_merge = ['ma_tinh', 'Province_Code']
     if 'ten_tinh' not in gdf.columns:
@@ -183,40 +240,229 @@ def load_and_prep_data():
     gdf = gdf.merge(df_prov[cols_to_merge], on='ma_tinh', how='left')
     return gdf, df_prov
 
+def geometry_to_path(geom):
+    """Converts a (Multi)Polygon into one compound matplotlib Path, holes included."""
+    if geom is None or geom.is_empty:
+        return Path(np.empty((0, 2)))
+    polygons = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+    rings = []
+    for poly in polygons:
+        rings.append(Path(np.asarray(poly.exterior.coords)[:, :2]))
+        rings.extend(Path(np.asarray(ring.coords)[:, :2]) for ring in poly.interiors)
+    return Path.make_compound_path(*rings)
+
+def build_base_map_layer(gdf):
+    """
+    Converts province geometry to matplotlib paths once per geometry set.
+    Each map then only recolors these paths instead of re-plotting the GeoDataFrame.
+    """
+    # Precomputed anchors and bounding boxes come with the geometry cache
+    if 'label_x' in gdf.columns:
+        label_xy = gdf[['label_x', 'label_y']].to_numpy(dtype=float)
+        boxes = np.array(gdf['bbox'].tolist(), dtype=float)
+        bounds = [boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()]
+    else:
+        label_points = gdf.geometry.representative_point()
+        label_xy = np.column_stack([label_points.x.to_numpy(), label_points.y.to_numpy()])
+        bounds = gdf.total_bounds
+    
+    # Same aspect rule geopandas applies for geographic coordinates
+    aspect = 'equal'
+    if gdf.crs is not None and gdf.crs.is_geographic:
+        aspect = 1 / np.cos(np.deg2rad((bounds[1] + bounds[3]) / 2))
+    
+    return {
+        'paths': [geometry_to_path(geom) for geom in gdf.geometry],
+        'province_codes': gdf['Province_Code'].to_numpy(),
+        'names': gdf['ten_tinh'].to_numpy() if 'ten_tinh' in gdf.columns else np.full(len(gdf), None),
+        'label_xy': label_xy,
+        'aspect': aspect
+    }
+
+def draw_base_map(ax, base_layer, scores, cmap, vmin, vmax):
+    """Draws every province in one collection: grey where scores is NaN, colormapped elsewhere."""
+    norm = mcolors.Normalize(vmin=vmin, vmax=vmax)
+    face_colors = np.tile(mcolors.to_rgba('#eeeeee'), (len(scores), 1))
+    valid = ~np.isnan(scores)
+    face_colors[valid] = cmap(norm(scores[valid]))
+    
+    collection = PathCollection(base_layer['paths'], facecolors=face_colors, edgecolors='white', linewidths=0.8)
+    ax.add_collection(collection, autolim=True)
+    ax.autoscale_view()
+    ax.set_aspect(base_layer['aspect'])
+    return collection
+
+def read_score_slice(csv_path, score_cols, years=None, subjects=None, chunksize=DIST_CHUNK_ROWS):
+    """
+    Streams a score CSV in chunks and keeps only rows for the requested years/subjects,
+    so peak memory follows the slice size rather than the whole file.
+    """
+    parts = []
+    for chunk in pd.read_csv(csv_path, dtype=str, encoding='utf-8-sig', chunksize=chunksize):
+        chunk.columns = chunk.columns.str.strip()
+        mask = np.ones(len(chunk), dtype=bool)
+        if years is not None:
+            mask &= pd.to_numeric(chunk['Year'], errors='coerce').isin(years).to_numpy()
+        if subjects is not None:
+            mask &= chunk['Subject'].isin(subjects).to_numpy()
+        parts.append(chunk[mask])
+    
+    if not parts:
+        parts.append(pd.read_csv(csv_path, dtype=str, encoding='utf-8-sig', nrows=0))
+    
+    raw = pd.concat(parts, ignore_index=True)
+    df = clean_data_frame(raw, year_col='Year', prov_col='Province_Code', score_cols=score_cols)
+    return apply_score_schema(df)
+
+def compute_subject_color_limits(df_avg, clip=COLOR_LIMIT_CLIP):
+    """
+    Derives per-subject (min, max) province averages in one groupby.
+    With clip > 0 the limits are the clip / 1-clip quantiles instead, to ignore outliers.
+    """
+    provinces = df_avg[~df_avg['Province_Code'].isin(['99', 'CaNuoc', '00'])].dropna(subset=['Average_Score'])
+    grouped = provinces.groupby('Subject', observed=True)['Average_Score']
+    if clip > 0:
+        lows, highs = grouped.quantile(clip), grouped.quantile(1 - clip)
+    else:
+        lows, highs = grouped.min(), grouped.max()
+    return {str(subj): (round(float(lows[subj]), 2), round(float(highs[subj]), 2)) for subj in lows.index}
+
+def load_subject_color_limits(df_avg, clip=COLOR_LIMIT_CLIP):
+    """Returns derived color limits, cached in CACHE_DIR until the average-score CSV or clip changes."""
+    cache_path = os.path.join(CACHE_DIR, COLOR_LIMITS_CACHE_NAME)
+    source_hash = file_sha256(AVG_SCORES_CSV_PATH)
+    
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('source_sha256') == source_hash and cached.get('clip') == clip:
+            return {subj: tuple(lim) for subj, lim in cached['limits'].items()}
+    
+    limits = compute_subject_color_limits(df_avg, clip)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Map workers may fill a cold cache at once: each writes its own temporary file and swaps it in
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{COLOR_LIMITS_CACHE_NAME}.", suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'source_sha256': source_hash, 'clip': clip, 'limits': limits}, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    return limits
+
+def get_color_limits(subject, theoretical_max, derived_limits):
+    """Picks vmin/vmax: manual SUBJECT_COLOR_LIMITS first, then derived limits, then (0, max)."""
+    if subject in SUBJECT_COLOR_LIMITS:
+        return SUBJECT_COLOR_LIMITS[subject]
+    if subject in derived_limits:
+        return derived_limits[subject]
+    return 0, theoretical_max
+
+def load_map_dataset(years=None, subjects=None, color_clip=COLOR_LIMIT_CLIP):
+    """
+    Loads geometry, province table and cleaned score frames once, for reuse across many maps.
+    Passing years/subjects streams only that slice of the distribution CSV (single-map runs).
+    color_clip is the fraction ignored at each end when deriving the color limits.
+    """
+    gdf, df_prov = load_and_prep_data()
+    
+    df_avg = load_cached_score_frame(AVG_SCORES_CSV_PATH, score_cols=['Average_Score'])
+    if years is None and subjects is None:
+        df_dist = load_cached_score_frame(DIST_SCORES_CSV_PATH, score_cols=['Score', 'Count', 'Cumulative'])
+    else:
+        df_dist = read_score_slice(DIST_SCORES_CSV_PATH, score_cols=['Score', 'Count', 'Cumulative'],
+                                   years=years, subjects=subjects)
+    
+    return {
+        'gdf': gdf,
+        'base_layer': build_base_map_layer(gdf),
+        'df_prov': df_prov,
+        'df_avg': df_avg,
+        'df_dist': df_dist,
+        'color_limits': load_subject_color_limits(df_avg, color_clip)
+    }
+
+def map_output_path(year, subject):
+    return f"{OUTPUT_DIR}/Map_{year}_{subject}.png"
+
+def map_output_files(year, subject, pyramid=False):
+    """Files a map render produces; used to detect missing outputs in incremental runs."""
+    files = [map_output_path(year, subject)]
+    if pyramid:
+        base = os.path.splitext(map_output_path(year, subject))[0]
+        files += [f"{base}_medium.png", f"{base}_thumb.png", os.path.join(f"{base}_tiles", '0', '0', '0.png')]
+    return files
+
+def map_target_digests(dataset, jobs, table_renderer=DEFAULT_TABLE_RENDERER, pyramid=False):
+    """
+    Hashes each (year, subject) job's avg/dist data slices together with everything
+    else that affects the image: province table, geometry, color limits and figure constants.
+    """
+    gdf = dataset['gdf']
+    geometry_hash = hashlib.sha256(b''.join(w or b'' for w in gdf.geometry.to_wkb())).hexdigest()
+    static_digest = params_digest(frame_digest(dataset['df_prov']), geometry_hash, MAP_GEOMETRY_TOLERANCE)
+    
+    avg_digests = group_digests(dataset['df_avg'], ['Year', 'Subject'])
+    dist_digests = group_digests(dataset['df_dist'], ['Year', 'Subject'])
+    
+    digests = {}
+    for year, subject in jobs:
+        theoretical_max = get_max_score_theoretical(subject, year)
+        color_limits = get_color_limits(subject, theoretical_max, dataset['color_limits'])
+        digests[(year, subject)] = params_digest(
+            year, subject, theoretical_max, color_limits, get_chart_title(year, subject),
+            table_renderer, pyramid, MAP_FIGSIZE, MAP_DPI, MAP_RENDER_VERSION, static_digest,
+            avg_digests.get((year, subject)), dist_digests.get((year, subject))
+        )
+    return digests
+
 def get_stats_for_table(year, subject, max_score, df_dist, df_avg, df_prov):
+    """Builds the detail-table rows for one year/subject with a single grouped pass per frame."""
     percentages = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
     thresholds = [p * max_score for p in percentages]
     
-    sub_dist = df_dist[(df_dist['Year'] == year) & (df_dist['Subject'] == subject)].copy()
-    sub_avg = df_avg[(df_avg['Year'] == year) & (df_avg['Subject'] == subject)].copy()
+    sub_dist = df_dist[(df_dist['Year'] == year) & (df_dist['Subject'] == subject)]
+    sub_avg = df_avg[(df_avg['Year'] == year) & (df_avg['Subject'] == subject)]
+    
+    # Per-province average (first row wins, as in the source CSV order)
+    avg_by_prov = sub_avg.drop_duplicates(subset='Province_Code').set_index('Province_Code')['Average_Score']
+    avg_by_prov.index = avg_by_prov.index.astype(str)
+    
+    # Candidate counts at or above each threshold, summed per province in one groupby
+    counts = np.nan_to_num(sub_dist['Count'].to_numpy(dtype=float))
+    scores = sub_dist['Score'].to_numpy(dtype=float)
+    ge_cols = [f'ge_{t}' for t in thresholds]
+    ge_matrix = (scores[:, None] >= np.array(thresholds)[None, :]) * counts[:, None]
+    
+    per_prov = pd.DataFrame(ge_matrix, columns=ge_cols)
+    per_prov['Province_Code'] = sub_dist['Province_Code'].astype(str).to_numpy()
+    per_prov['Count'] = counts
+    agg = {'Count': 'sum', **{c: 'sum' for c in ge_cols}}
+    if 'Cumulative' in sub_dist.columns:
+        per_prov['Cumulative'] = sub_dist['Cumulative'].to_numpy(dtype=float)
+        agg['Cumulative'] = 'max'
+    dist_stats = per_prov.groupby('Province_Code', sort=False).agg(agg)
+    
+    # Prefer the max cumulative as the candidate total, falling back to the count sum
+    if 'Cumulative' in dist_stats.columns:
+        cum_max = dist_stats['Cumulative']
+        dist_stats['Total'] = cum_max.where(cum_max.notna() & (cum_max != 0), dist_stats['Count'])
+    else:
+        dist_stats['Total'] = dist_stats['Count']
+    
+    prov_names = df_prov.drop_duplicates(subset='Province_Code').set_index('Province_Code')['ten_tinh']
     
     table_rows = []
-    valid_provinces = df_prov['Province_Code'].unique()
-    
     national_sums = {t: 0 for t in thresholds}
     national_total_count = 0
     
-    for prov_code in valid_provinces:
-        prov_name_series = df_prov[df_prov['Province_Code'] == prov_code]['ten_tinh']
-        if prov_name_series.empty: continue
-        prov_name = prov_name_series.values[0]
-        
-        avg_row = sub_avg[sub_avg['Province_Code'] == prov_code]
-        avg_score = avg_row['Average_Score'].values[0] if not avg_row.empty else 0.0
+    for prov_code, prov_name in prov_names.items():
+        has_avg = prov_code in avg_by_prov.index
+        has_dist = prov_code in dist_stats.index
+        if not has_avg and not has_dist:
+            continue
         
-        prov_dist = sub_dist[sub_dist['Province_Code'] == prov_code]
+        avg_score = avg_by_prov[prov_code] if has_avg else 0.0
+        stats = dist_stats.loc[prov_code] if has_dist else None
+        total_count = stats['Total'] if has_dist else 0
         
-        if prov_dist.empty and avg_row.empty:
-            continue
-            
-        if 'Cumulative' in prov_dist.columns:
-            total_count = prov_dist['Cumulative'].max()
-        else:
-            total_count = prov_dist['Count'].sum()
-            
-        if pd.isna(total_count) or total_count == 0:
-            total_count = prov_dist['Count'].sum()
-
         national_total_count += total_count
         
         row_data = {
@@ -225,10 +471,10 @@ def get_stats_for_table(year, subject, max_score, df_dist, df_avg, df_prov):
             'Avg': float(avg_score) if not pd.isna(avg_score) else 0.0
         }
         
-        for t in thresholds:
-            count_ge = prov_dist[prov_dist['Score'] >= t]['Count'].sum()
-            row_data[f'ge_{t}'] = int(count_ge)
-            national_sums[t] += int(count_ge)
+        for t, col in zip(thresholds, ge_cols):
+            count_ge = int(stats[col]) if has_dist else 0
+            row_data[col] = count_ge
+            national_sums[t] += count_ge
             
         table_rows.append(row_data)
         
@@ -253,46 +499,223 @@ def get_stats_for_table(year, subject, max_score, df_dist, df_avg, df_prov):
         
     return table_rows, national_row, thresholds
 
+def table_row_style(row_idx, n_rows):
+    """Returns (facecolor, font weight) for body row row_idx; the last row is the national total."""
+    if row_idx == n_rows - 1:
+        return TABLE_NATIONAL_COLOR, 'bold'
+    return TABLE_ROW_COLORS[row_idx % 2], 'normal'
+
+def draw_cell_table(ax_table, headers, cell_text, col_widths):
+    """Draws the detail table with matplotlib.table.Table, one Cell per value."""
+    the_table = Table(ax_table, bbox=[0, 0, 1, 1])
+    
+    # Add Header
+    for i, h in enumerate(headers):
+        cell = the_table.add_cell(0, i, width=col_widths[i], height=TABLE_HEADER_HEIGHT, 
+                                  text=h, loc='center', facecolor=TABLE_HEADER_COLOR)
+        cell.get_text().set_weight('bold')
+        # UPDATED: Font size increased by ~20% (28 -> 34)
+        cell.get_text().set_fontsize(TABLE_HEADER_FONTSIZE)
+    
+    # Add Rows
+    for row_idx, row_data in enumerate(cell_text):
+        row_color, font_weight = table_row_style(row_idx, len(cell_text))
+        
+        for col_idx, val in enumerate(row_data):
+            cell = the_table.add_cell(row_idx + 1, col_idx, width=col_widths[col_idx], height=TABLE_ROW_HEIGHT,
+                                      text=str(val), loc='center', facecolor=row_color)
+            # UPDATED: Font size increased by ~20% (24 -> 29)
+            cell.get_text().set_fontsize(TABLE_ROW_FONTSIZE)
+            cell.get_text().set_weight(font_weight)
+            if col_idx == 0: cell.get_text().set_weight('bold')
+
+    ax_table.add_table(the_table)
+
+def fit_table_font_size(renderer, cells, col_widths_px):
+    """
+    Mirrors Table's auto font sizing: each cell shrinks 1pt at a time until its text
+    (plus 10% padding per side) fits the column, and the whole table uses the smallest size.
+    Widths are measured once per cell at a reference size and scaled linearly.
+    """
+    ref_size = 100.0
+    fontsize = TABLE_HEADER_FONTSIZE
+    for text, weight, _, col, start_size in cells:
+        if not text:
+            continue
+        prop = FontProperties(weight=weight, size=ref_size)
+        w_ref, _, _ = renderer.get_text_width_height_descent(text, prop, ismath=False)
+        size = start_size
+        while size > 1 and w_ref * size / ref_size * 1.2 > col_widths_px[col]:
+            size -= 1
+        fontsize = min(fontsize, size)
+    return fontsize
+
+def draw_fast_table(ax_table, headers, cell_text, col_widths):
+    """
+    Draws the same table as draw_cell_table using a handful of artists:
+    one PolyCollection for row backgrounds, one LineCollection for the grid
+    and one PathCollection of glyph outlines per column.
+    """
+    fig = ax_table.get_figure()
+    renderer = fig.canvas.get_renderer()
+    n_rows = len(cell_text)
+    n_cols = len(headers)
+    
+    # Layout in axes coordinates, scaled to fill the axes like Table(bbox=[0, 0, 1, 1])
+    x_edges = np.concatenate([[0.0], np.cumsum(col_widths)]) / sum(col_widths)
+    heights = np.array([TABLE_HEADER_HEIGHT] + [TABLE_ROW_HEIGHT] * n_rows)
+    y_edges = 1.0 - np.concatenate([[0.0], np.cumsum(heights)]) / heights.sum()
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    
+    # Per-cell (text, weight, row, column, starting font size), header is row 0
+    cells = [(h, 'bold', 0, i, TABLE_HEADER_FONTSIZE) for i, h in enumerate(headers)]
+    row_colors = [TABLE_HEADER_COLOR]
+    for row_idx, row_data in enumerate(cell_text):
+        row_color, font_weight = table_row_style(row_idx, n_rows)
+        row_colors.append(row_color)
+        for col_idx, val in enumerate(row_data):
+            weight = 'bold' if col_idx == 0 else font_weight
+            cells.append((str(val), weight, row_idx + 1, col_idx, TABLE_ROW_FONTSIZE))
+    
+    # Table sizes fonts against the unscaled widths, before fitting to the bbox
+    ax_width_px = ax_table.get_window_extent(renderer).width
+    fontsize = fit_table_font_size(renderer, cells, [w * ax_width_px for w in col_widths])
+    
+    # Row backgrounds
+    quads = [[(0, y_edges[i + 1]), (1, y_edges[i + 1]), (1, y_edges[i]), (0, y_edges[i])] for i in range(n_rows + 1)]
+    backgrounds = PolyCollection(quads, facecolors=row_colors, edgecolors='none',
+                                 transform=ax_table.transAxes, clip_on=False)
+    ax_table.add_collection(backgrounds, autolim=False)
+    
+    # Grid lines (cell borders)
+    segments = [[(0, y), (1, y)] for y in y_edges] + [[(x, y_edges[-1]), (x, 1)] for x in x_edges]
+    grid = LineCollection(segments, colors='k', linewidths=plt.rcParams['patch.linewidth'],
+                          transform=ax_table.transAxes, clip_on=False)
+    ax_table.add_collection(grid, autolim=False)
+    
+    # Text: glyph outlines in points, centered on each cell like va/ha='center'
+    px_to_pt = 72.0 / fig.dpi
+    props = {w: FontProperties(weight=w, size=fontsize) for w in ('bold', 'normal')}
+    _, lp_h, lp_d = renderer.get_text_width_height_descent('lp', props['normal'], ismath=False)
+    
+    col_paths = [[] for _ in range(n_cols)]
+    col_offsets = [[] for _ in range(n_cols)]
+    for text, weight, row, col, _ in cells:
+        if not text:
+            continue
+        w, h, d = renderer.get_text_width_height_descent(text, props[weight], ismath=False)
+        h, d = max(h, lp_h), max(d, lp_d)
+        glyphs = TextPath((0, 0), text, prop=props[weight])
+        shift = Affine2D().translate(-w / 2 * px_to_pt, (d - h / 2) * px_to_pt)
+        col_paths[col].append(shift.transform_path(glyphs))
+        col_offsets[col].append((x_centers[col], y_centers[row]))
+    
+    pt_to_px = Affine2D().scale(1.0 / px_to_pt)
+    for col in range(n_cols):
+        if not col_paths[col]:
+            continue
+        texts = PathCollection(col_paths[col], facecolors='black', edgecolors='none',
+                               offsets=col_offsets[col], offset_transform=ax_table.transAxes,
+                               transform=pt_to_px, clip_on=False)
+        ax_table.add_collection(texts, autolim=False)
+
+def render_figure_image(fig, pad_inches=1):
+    """
+    Draws the figure once with a tight bbox into an Agg RGBA buffer and wraps it as a PIL image,
+    so the full-size PNG and every downscaled output come from the same render.
+    """
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(pad_inches)
+    width, height = int(bbox.width * fig.dpi), int(bbox.height * fig.dpi)
+    
+    buf = io.BytesIO()
+    fig.savefig(buf, format='raw', bbox_inches='tight', pad_inches=pad_inches)
+    data = buf.getvalue()
+    if len(data) != width * height * 4:
+        # Size estimate disagrees with Agg; fall back to a decoded PNG
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight', pad_inches=pad_inches)
+        buf.seek(0)
+        return Image.open(buf).convert('RGBA')
+    return Image.frombuffer('RGBA', (width, height), data, 'raw', 'RGBA', 0, 1)
+
+def write_map_pyramid(image, output_filename):
+    """
+    Writes <name>_medium.png, <name>_thumb.png and slippy-map style tiles
+    (<name>_tiles/{z}/{x}/{y}.png, zoom 0 = whole map in one tile) from one full-size image.
+    """
+    base = os.path.splitext(output_filename)[0]
+    
+    medium = image.copy()
+    medium.thumbnail((PYRAMID_MEDIUM_SIZE, PYRAMID_MEDIUM_SIZE), Image.LANCZOS)
+    medium.save(f"{base}_medium.png")
+    thumb = medium.copy()
+    thumb.thumbnail((PYRAMID_THUMB_SIZE, PYRAMID_THUMB_SIZE), Image.LANCZOS)
+    thumb.save(f"{base}_thumb.png")
+    
+    tiles_dir = f"{base}_tiles"
+    if os.path.isdir(tiles_dir):
+        shutil.rmtree(tiles_dir)
+    
+    # Each zoom level halves the previous one; edge tiles are padded with transparency
+    max_zoom = max(0, math.ceil(math.log2(max(image.size) / PYRAMID_TILE_SIZE)))
+    level = image
+    for z in range(max_zoom, -1, -1):
+        n_cols = math.ceil(level.width / PYRAMID_TILE_SIZE)
+        n_rows = math.ceil(level.height / PYRAMID_TILE_SIZE)
+        for x in range(n_cols):
+            os.makedirs(os.path.join(tiles_dir, str(z), str(x)), exist_ok=True)
+            for y in range(n_rows):
+                box = (x * PYRAMID_TILE_SIZE, y * PYRAMID_TILE_SIZE,
+                       (x + 1) * PYRAMID_TILE_SIZE, (y + 1) * PYRAMID_TILE_SIZE)
+                level.crop(box).save(os.path.join(tiles_dir, str(z), str(x), f"{y}.png"))
+        if z > 0:
+            level = level.reduce(2)
+
 # ==========================================
 # 4. PLOTTING FUNCTION
 # ==========================================
 
-def generate_exam_map(year, subject):
+def generate_exam_map(year, subject, dataset=None, table_renderer=DEFAULT_TABLE_RENDERER, pyramid=False):
+    """
+    Renders one map. Pass a dataset from load_map_dataset() to skip re-reading the source files.
+    table_renderer selects the detail table path: 'fast' (collections) or 'table' (matplotlib Table).
+    pyramid=True also writes a medium image, a thumbnail and map tiles from the same render.
+    """
     print(f"Processing: Year {year}, Subject {subject}")
     
-    # 1. Load Data
-    gdf, df_prov = load_and_prep_data()
-    
-    raw_avg = pd.read_csv(AVG_SCORES_CSV_PATH, dtype=str, low_memory=False, encoding='utf-8-sig')
-    raw_dist = pd.read_csv(DIST_SCORES_CSV_PATH, dtype=str, low_memory=False, encoding='utf-8-sig')
+    # 1. Load Data (only when no preloaded dataset is given; then just this slice)
+    if dataset is None:
+        dataset = load_map_dataset(years=[year], subjects=[subject])
     
-    df_avg = clean_data_frame(raw_avg, year_col='Year', prov_col='Province_Code', score_cols=['Average_Score'])
-    df_dist = clean_data_frame(raw_dist, year_col='Year', prov_col='Province_Code', score_cols=['Score', 'Count', 'Cumulative'])
+    base_layer = dataset['base_layer']
+    df_prov = dataset['df_prov']
+    df_avg = dataset['df_avg']
+    df_dist = dataset['df_dist']
     
     # 2. Settings
     # Theoretical Max for Table Calculations (15, 18, 24...)
     theoretical_max = get_max_score_theoretical(subject, year)
     
-    # Custom Min/Max for Color Scaling
-    if subject in SUBJECT_COLOR_LIMITS:
-        vmin, vmax = SUBJECT_COLOR_LIMITS[subject]
-    else:
-        # Fallback if subject not in list
-        vmin, vmax = 0, theoretical_max
+    # Custom Min/Max for Color Scaling (manual override > derived from data > theoretical)
+    vmin, vmax = get_color_limits(subject, theoretical_max, dataset['color_limits'])
         
     title_text = get_chart_title(year, subject)
     custom_cmap = create_custom_colormap()
     
     # 3. Prepare Map Data
-    current_avg = df_avg[(df_avg['Year'] == year) & (df_avg['Subject'] == subject)].copy()
-    map_data = gdf.merge(current_avg, on='Province_Code', how='left')
+    current_avg = df_avg[(df_avg['Year'] == year) & (df_avg['Subject'] == subject)]
+    avg_by_prov = current_avg.drop_duplicates(subset='Province_Code').set_index('Province_Code')['Average_Score']
+    avg_by_prov.index = avg_by_prov.index.astype(str)
+    # Scores aligned to the base layer's geometry order (NaN = no data)
+    map_scores = pd.Series(base_layer['province_codes']).map(avg_by_prov).to_numpy(dtype=float)
     
     # 4. Prepare Table Data
     rows, nat_row, thresholds = get_stats_for_table(year, subject, theoretical_max, df_dist, df_avg, df_prov)
     
     # 5. Initialize Plot
     plt.rcParams['font.family'] = 'Times New Roman'
-    fig = plt.figure(figsize=(50, 50), dpi=100)
+    fig = plt.figure(figsize=MAP_FIGSIZE, dpi=MAP_DPI)
     
     ax_map = fig.add_axes([0, 0, 1, 1]) 
     ax_table = fig.add_axes([0.65, 0.15, 0.30, 0.60]) 
@@ -311,27 +734,20 @@ def generate_exam_map(year, subject):
     # 7. Draw Map
     ax_map.axis('off')
     
-    gdf.plot(ax=ax_map, color='#eeeeee', edgecolor='white', linewidth=0.8)
+    draw_base_map(ax_map, base_layer, map_scores, custom_cmap, vmin, vmax)
     
-    valid_map_data = map_data.dropna(subset=['Average_Score'])
+    valid_idx = np.flatnonzero(~np.isnan(map_scores))
     
-    if not valid_map_data.empty:
-        # Apply specific vmin/vmax from SUBJECT_COLOR_LIMITS
-        valid_map_data.plot(column='Average_Score', ax=ax_map, cmap=custom_cmap, 
-                            vmin=vmin, vmax=vmax, edgecolor='white', linewidth=0.8)
-        
+    if len(valid_idx) > 0:
         # Labels
-        for idx, row in valid_map_data.iterrows():
-            pt = row['geometry'].representative_point()
-            x, y = pt.x, pt.y
+        for i in valid_idx:
+            x, y = base_layer['label_xy'][i]
             
-            prov_name = ""
-            if 'ten_tinh' in row and pd.notna(row['ten_tinh']):
-                prov_name = row['ten_tinh']
-            elif 'ten_tinh_x' in row and pd.notna(row['ten_tinh_x']):
-                prov_name = row['ten_tinh_x']
+            prov_name = base_layer['names'][i]
+            if pd.isna(prov_name):
+                prov_name = ""
             
-            score_val = row['Average_Score']
+            score_val = map_scores[i]
             label_text = f"{prov_name}\n{score_val:.2f}"
             
             txt = ax_map.text(x, y, label_text, ha='center', va='center', fontsize=18, fontweight='bold', color='black')
@@ -367,8 +783,6 @@ def generate_exam_map(year, subject):
         nat_content.append(fmt_int(nat_row[f'ge_{t}']))
     cell_text.append(nat_content)
     
-    the_table = Table(ax_table, bbox=[0, 0, 1, 1])
-    
     n_thresholds = len(thresholds)
     
     # UPDATED: Fixed widths logic
@@ -376,59 +790,145 @@ def generate_exam_map(year, subject):
     # w_rest (Threshold columns) = same width as "SL TS" = 0.08
     col_widths = [0.05, 0.15, 0.08, 0.08] + [0.08] * n_thresholds
     
-    # Add Header
-    for i, h in enumerate(headers):
-        cell = the_table.add_cell(0, i, width=col_widths[i], height=0.03, 
-                                  text=h, loc='center', facecolor='#e0e0e0')
-        cell.get_text().set_weight('bold')
-        # UPDATED: Font size increased by ~20% (28 -> 34)
-        cell.get_text().set_fontsize(34)
+    if table_renderer == 'fast':
+        draw_fast_table(ax_table, headers, cell_text, col_widths)
+    else:
+        draw_cell_table(ax_table, headers, cell_text, col_widths)
     
-    # Add Rows
-    for row_idx, row_data in enumerate(cell_text):
-        is_last = (row_idx == len(cell_text) - 1)
-        row_color = '#fff3e0' if is_last else ('#ffffff' if row_idx % 2 == 0 else '#f9f9f9')
-        font_weight = 'bold' if is_last else 'normal'
-        
-        for col_idx, val in enumerate(row_data):
-            cell = the_table.add_cell(row_idx + 1, col_idx, width=col_widths[col_idx], height=0.022,
-                                      text=str(val), loc='center', facecolor=row_color)
-            # UPDATED: Font size increased by ~20% (24 -> 29)
-            cell.get_text().set_fontsize(29)
-            cell.get_text().set_weight(font_weight)
-            if col_idx == 0: cell.get_text().set_weight('bold')
-
-    ax_table.add_table(the_table)
     title_obj = ax_table.text(0.5, 1.01, "DỮ LIỆU CHI TIẾT", ha='center', va='bottom', fontsize=40, fontweight='bold', color='black')
     title_obj.set_path_effects([pe.withStroke(linewidth=4, foreground='white')])
 
     # 9. Save
-    output_filename = f"{OUTPUT_DIR}/Map_{year}_{subject}.png"
-    plt.savefig(output_filename, bbox_inches='tight', pad_inches=1)
+    output_filename = map_output_path(year, subject)
+    image = render_figure_image(fig, pad_inches=1)
+    image.save(output_filename, dpi=(MAP_DPI, MAP_DPI))
+    if pyramid:
+        write_map_pyramid(image, output_filename)
     print(f"Success: {output_filename}")
-    plt.close()
+    plt.close(fig)
 
-if __name__ == "__main__":
-    # Load the data to identify available years
-    df_all = pd.read_csv(AVG_SCORES_CSV_PATH)
-    years = sorted(df_all['Year'].unique())
-    
-    target_subject = "KhoiD"
+# ==========================================
+# 5. BATCH RENDERING
+# ==========================================
 
-    print(f"Starting processing for Subject: {target_subject}")
-    print(f"Years found: {years}")
+# Dataset loaded once per worker process by _init_render_worker()
+_worker_dataset = None
 
-    for year in years:
-        try:
-            # Check if data exists for this specific combination before plotting
-            mask = (df_all['Year'] == year) & (df_all['Subject'] == target_subject)
-            
-            if not df_all[mask].empty:
-                generate_exam_map(int(year), target_subject)
-            else:
-                print(f"Skipping: No data for {year} - {target_subject}")
-                
-        except Exception as e:
-            print(f"Error processing {year} - {target_subject}: {e}")
-            
-    print("Processing complete!")
\ No newline at end of file
+def _init_render_worker(color_clip=COLOR_LIMIT_CLIP):
+    global _worker_dataset
+    plt.switch_backend('Agg')
+    _worker_dataset = load_map_dataset(color_clip=color_clip)
+
+def _render_map_job(job, dataset=None, table_renderer=DEFAULT_TABLE_RENDERER, pyramid=False):
+    """Renders one (year, subject) map and reports the outcome instead of raising."""
+    year, subject = job
+    start = time.perf_counter()
+    try:
+        generate_exam_map(year, subject, dataset=dataset if dataset is not None else _worker_dataset,
+                          table_renderer=table_renderer, pyramid=pyramid)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return map_job_result(job, error, time.perf_counter() - start)
+
+def map_job_result(job, error=None, seconds=0.0):
+    year, subject = job
+    return {
+        'year': year,
+        'subject': subject,
+        'ok': error is None,
+        'error': error,
+        'seconds': seconds
+    }
+
+def list_map_jobs(df_avg, years=None, subjects=None):
+    """Returns every (year, subject) pair present in the average-score data, optionally filtered."""
+    pairs = df_avg[['Year', 'Subject']].drop_duplicates()
+    if years:
+        pairs = pairs[pairs['Year'].isin(years)]
+    if subjects:
+        pairs = pairs[pairs['Subject'].isin(subjects)]
+    return sorted((int(y), str(s)) for y, s in pairs.itertuples(index=False))
+
+def render_map_batch(jobs, workers=None, dataset=None, table_renderer=DEFAULT_TABLE_RENDERER, pyramid=False,
+                     color_clip=COLOR_LIMIT_CLIP):
+    """
+    Renders all jobs across a pool of worker processes, each loading the dataset once.
+    workers=1 renders in this process using the given (or a freshly loaded) dataset.
+    Returns one result dict per job; failures are collected, not raised, including jobs
+    lost with a worker process that died (e.g. killed for running out of memory).
+    """
+    results = []
+    # Every worker loads the full dataset, so never start more of them than there are jobs
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    
+    if workers == 1:
+        if dataset is None:
+            dataset = load_map_dataset(color_clip=color_clip)
+        for job in jobs:
+            results.append(_render_map_job(job, dataset, table_renderer, pyramid))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                 initargs=(color_clip,)) as pool:
+            futures = {pool.submit(_render_map_job, job, None, table_renderer, pyramid): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception:
+                    # A dead worker breaks the pool: its job and every pending one fail here
+                    results.append(map_job_result(futures[future], traceback.format_exc()))
+    
+    results.sort(key=lambda r: (r['year'], r['subject']))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render average-score maps for every (year, subject) pair.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--year', type=int, action='append', help="Only render this year (repeatable)")
+    parser.add_argument('--subject', action='append', help="Only render this subject (repeatable)")
+    parser.add_argument('--table-renderer', choices=['fast', 'table'], default=DEFAULT_TABLE_RENDERER,
+                        help="Detail table renderer (default: %(default)s)")
+    parser.add_argument('--pyramid', action='store_true', help="Also write medium/thumbnail images and map tiles")
+    parser.add_argument('--force', action='store_true', help="Re-render even if inputs are unchanged")
+    parser.add_argument('--color-clip', type=float, default=COLOR_LIMIT_CLIP,
+                        help="Fraction of province averages ignored at each end when deriving color limits "
+                             "(default: %(default)s = min/max)")
+    args = parser.parse_args()
+    if not 0 <= args.color_clip < 0.5:
+        parser.error("--color-clip must be in [0, 0.5)")
+    
+    # Loading here also warms the Feather cache before any worker starts
+    load_start = time.perf_counter()
+    dataset = load_map_dataset(color_clip=args.color_clip)
+    print(f"Dataset loaded in {time.perf_counter() - load_start:.2f}s")
+    
+    all_jobs = list_map_jobs(dataset['df_avg'], years=args.year, subjects=args.subject)
+    
+    # Skip maps whose data slice and rendering parameters are unchanged since the last build
+    manifest = load_manifest(MANIFEST_PATH)
+    digests = map_target_digests(dataset, all_jobs, args.table_renderer, args.pyramid)
+    jobs = [job for job in all_jobs
+            if args.force or not is_up_to_date(manifest, map_output_path(*job), digests[job],
+                                               map_output_files(*job, pyramid=args.pyramid))]
+    print(f"Up to date: {len(all_jobs) - len(jobs)} maps. "
+          f"Rendering {len(jobs)} maps with {min(args.workers or os.cpu_count() or 1, max(len(jobs), 1))} worker(s)")
+    
+    render_start = time.perf_counter()
+    results = render_map_batch(jobs, workers=args.workers, dataset=dataset,
+                               table_renderer=args.table_renderer, pyramid=args.pyramid,
+                               color_clip=args.color_clip)
+    
+    for r in results:
+        if r['ok']:
+            job = (r['year'], r['subject'])
+            record_target(manifest, map_output_path(*job), digests[job])
+    save_manifest(manifest, MANIFEST_PATH)
+    
+    failed = [r for r in results if not r['ok']]
+    for r in failed:
+        print(f"Error processing {r['year']} - {r['subject']}:\n{r['error']}")
+    
+    print(f"Processing complete! {len(results) - len(failed)}/{len(results)} maps rendered "
+          f"in {time.perf_counter() - render_start:.2f}s")
+    if failed:
+        sys.exit(1)
@@ -1,172 +1,95 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import matplotlib.ticker as ticker
 import numpy as np
 import os
-import math
-
-# Use Agg backend for non-interactive image generation
-plt.switch_backend('Agg')
-
-# --- GLOBAL CONFIGURATION ---
-IMG_WIDTH_PX = 5000
-IMG_HEIGHT_PX = 2813
-DPI = 100
-FIG_SIZE = (IMG_WIDTH_PX / DPI, IMG_HEIGHT_PX / DPI)
-
-# Scaling factors
-SCALE_H = IMG_HEIGHT_PX / 1000 
-SCALE_W = IMG_WIDTH_PX / 1000
-
-# Font Configuration: Times New Roman
-plt.rcParams['font.family'] = 'serif'
-plt.rcParams['font.serif'] = ['Times New Roman']
-plt.rcParams['axes.unicode_minus'] = False 
-
-# --- SUBJECT MAPPING & STEP CONFIGURATION (For Subject Logic) ---
-SUBJECT_NAME_MAP = {
-    "NguVan": "Ngữ văn",
-    "Toan": "Toán",
-    "NgoaiNgu": "Ngoại ngữ",
-    "VatLy": "Vật lí",
-    "HoaHoc": "Hóa học",
-    "SinhHoc": "Sinh học",
-    "LichSu": "Lịch sử",
-    "DiaLy": "Địa lí",
-    "GDCD": "Giáo dục công dân",
-    "KinhTePhapLuat": "Kinh tế Pháp luật",
-    "TinHoc": "Tin học",
-    "CongNgheCongNghiep": "Công nghệ - Công nghiệp",
-    "CongNgheNongNghiep": "Công nghệ - Nông nghiệp"
-}
-
-# Structure: {Year: {Subject: Step}}
-STEP_CONFIG = {
-    2025: {"default": 0.25, "GDCD": None}, 
-    2024: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2023: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2022: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2021: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2020: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2019: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2018: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2017: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
-    2016: {"Toan": 0.25, "NgoaiNgu": 0.2, "VatLy": 0.2, "HoaHoc": 0.2, "SinhHoc": 0.2, "default": 0.25},
-}
-# Years 2007-2015 are all 0.25
-for y in range(2007, 2016):
-    STEP_CONFIG[y] = {"default": 0.25}
-
-# --- SHARED HELPER FUNCTIONS ---
-
-def get_y_tick_step(y_max):
-    """Calculates the Y-axis tick step (4-10 labels constraint)."""
-    if y_max <= 0: return 1.0
-    target = y_max / 10.0
-    exponent = np.floor(np.log10(target)) if target > 0 else 0
-    magnitude = 10 ** exponent
-    multipliers = [1, 2, 5]
-    candidates = []
-    for p in [magnitude/10, magnitude, magnitude*10]:
-        for m in multipliers:
-            candidates.append(m * p)
-    candidates = sorted(list(set(candidates)))
-    best_step = min(candidates, key=lambda x: abs(x - target))
-    try:
-        current_idx = candidates.index(best_step)
-    except ValueError:
-        current_idx = 0
-    while (y_max / candidates[current_idx]) > 10 and current_idx < len(candidates) - 1:
-        current_idx += 1
-    while (y_max / candidates[current_idx]) < 4 and current_idx > 0:
-        current_idx -= 1
-    return candidates[current_idx]
-
-def create_custom_colormap():
-    """Creates a colormap that transitions from Red -> Orange -> Dark Yellow -> Green."""
-    colors = [
-        (0.0, "#d73027"), # Red
-        (0.25, "#fc8d59"), # Orange
-        (0.5,  "#CCCC00"), # Darker Yellow/Mustard
-        (0.75, "#91cf60"), # Light Green
-        (1.0,  "#1a9850")  # Dark Green
-    ]
-    return mcolors.LinearSegmentedColormap.from_list("custom_exam_cmap", colors)
-
-def find_score_at_percentile(df, target_cumulative_count, score_col_name='min_score'):
-    """Finds the score where the cumulative count matches the target."""
-    # Ensure dataframe is sorted by score descending for cumulative check
-    temp_df = df.sort_values(by=score_col_name, ascending=False).reset_index(drop=True)
-    
-    # Recalculate cumulative if not present or just to be safe
-    temp_df['cum_calc'] = temp_df['count'].cumsum()
-    
-    idx = (temp_df['cum_calc'] - target_cumulative_count).abs().idxmin()
-    return temp_df.loc[idx, score_col_name]
+import sys
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from score_dist_stats import (Z_SCORE_DEFS, KHOI_SCORE_GRID, KHOI_MAX_SCORE, KHOI_THRESHOLDS, SUBJECT_MAX_SCORE,
+                              SUBJECT_THRESHOLDS, SUBJECT_NAME_MAP, STATS_OUTPUT_PATH, get_step_size, z_stat_name,
+                              khoi_score_bins, dense_counts, process_data_binning, single_group_stats,
+                              load_chart_inputs, compute_stats_table, write_stats_table)
+from build_manifest import load_manifest, save_manifest, frame_digest, params_digest, is_up_to_date, record_target
+
+# Drawing lives in score_dist_drawing, imported only on the rendering path, so --stats-only
+# and the manifest checks never load matplotlib
+
+# Build manifest for incremental runs; bump CHART_RENDER_VERSION when drawing code changes
+MANIFEST_PATH = 'score_dist_manifest.json'
+CHART_RENDER_VERSION = 3
+
+# Output formats written for every chart; each format is tracked separately in the manifest
+CHART_FORMATS = ('svg', 'png')
+
+def khoi_chart_basename(year, khoi):
+    return f"score_dist_{year}_{khoi}"
+
+def subject_chart_basename(year, subject, khoi_label):
+    if int(year) <= 2014:
+        return f"score_dist_mon_{year}_{subject}_{khoi_label}"
+    return f"score_dist_mon_{year}_{subject}"
+
+def chart_output_files(filename_base, formats=CHART_FORMATS):
+    return [f"{filename_base}.{fmt}" for fmt in formats]
+
+def khoi_chart_digest(group_df, year, khoi, high_score_data):
+    return params_digest(frame_digest(group_df), frame_digest(high_score_data), str(year), khoi,
+                         CHART_RENDER_VERSION)
+
+def subject_chart_digest(data_df, year, subject, khoi_label, step):
+    return params_digest(frame_digest(data_df), str(year), subject, str(khoi_label), step,
+                         CHART_RENDER_VERSION)
+
+def chart_is_up_to_date(manifest, filename_base, digest, formats=CHART_FORMATS):
+    """
+    True if every requested output of the chart exists and was built from the same inputs,
+    or if the same inputs were last found to have no data (recorded under the bare base name).
+    """
+    if manifest is None:
+        return False
+    if is_up_to_date(manifest, filename_base, digest, []):
+        return True
+    return all(
+        is_up_to_date(manifest, path, digest, [path])
+        for path in chart_output_files(filename_base, formats)
+    )
 
-def get_step_size(year, subject):
-    """Determines step size (0.2 or 0.25) based on year and subject."""
-    year_int = int(year)
-    if year_int not in STEP_CONFIG:
-        return 0.25
-    config = STEP_CONFIG[year_int]
-    if subject in config:
-        val = config[subject]
-        if val is None: return None
-        return val
-    if "default" in config:
-        return config["default"]
-    return 0.25
-
-def process_data_binning(df, step):
-    """Bins raw subject scores according to the step size."""
-    df_proc = df.copy()
-    df_proc['Score'] = pd.to_numeric(df_proc['Score'], errors='coerce')
-    df_proc['count'] = pd.to_numeric(df_proc['count'], errors='coerce').fillna(0)
-    
-    def calculate_bin(score):
-        if pd.isna(score): return 0
-        if math.isclose(score, 10.0, rel_tol=1e-9):
-            return 10.0
-        val = score / step
-        floored = math.floor(round(val, 6))
-        return round(floored * step, 3)
-
-    df_proc['score_bin'] = df_proc['Score'].apply(calculate_bin)
-    grouped = df_proc.groupby('score_bin')['count'].sum().reset_index()
-    grouped.rename(columns={'score_bin': 'score'}, inplace=True)
-    return grouped
+def record_chart(manifest, filename_base, digest, formats=CHART_FORMATS, no_data=False):
+    """Records the chart's outputs, or for a slice without data the slice itself, as built from digest."""
+    if manifest is None:
+        return
+    if no_data:
+        record_target(manifest, filename_base, digest)
+        return
+    manifest['targets'].pop(filename_base, None)
+    for fmt in formats:
+        record_target(manifest, f"{filename_base}.{fmt}", digest)
 
 # --- PART 1: KHOI (GROUP) CHART GENERATION ---
 
-def generate_khoi_chart(group_df, year, khoi, high_score_data=None):
-    # 1. Prepare Data
-    all_scores = np.arange(0, 30.25, 0.25)
-    df_grid = pd.DataFrame({'min_score': all_scores})
-    df_merged = pd.merge(df_grid, group_df, on='min_score', how='left')
-    df_merged['count'] = df_merged['count'].fillna(0)
+def generate_khoi_chart(group_df, year, khoi, high_score_data=None, manifest=None, templates=None,
+                        formats=CHART_FORMATS):
+    """Draws one khoi chart; returns the written file paths (empty if up to date or without data)."""
+    filename_base = khoi_chart_basename(year, khoi)
+    digest = khoi_chart_digest(group_df, year, khoi, high_score_data)
+    if chart_is_up_to_date(manifest, filename_base, digest, formats):
+        print(f"[Khoi] Up to date: {filename_base}")
+        return []
     
-    # Calculate cumulative
-    df_merged = df_merged.sort_values(by='min_score', ascending=False).reset_index(drop=True)
-    df_merged['cumulative'] = df_merged['count'].cumsum()
-    
-    # Sort back to ascending for plotting
-    df_merged = df_merged.sort_values(by='min_score', ascending=True)
-
-    x = df_merged['min_score'].values
-    y = df_merged['count'].values
+    # 1. Prepare Data: candidate count per quarter point, 0-30
+    bins = khoi_score_bins(group_df['min_score'])
+    y = dense_counts(np.zeros(len(bins), dtype=np.int64), bins, group_df['count'], 1, len(KHOI_SCORE_GRID))[0]
     
     max_count = y.max()
     if max_count <= 0:
         print(f"[Khoi] Skipping Year {year} Khoi {khoi}: No data.")
-        return
+        return []
 
-    total_candidates = df_merged['count'].sum()
-    
     # 2. Statistics Calculation
-    weighted_sum = np.sum(x * y)
-    avg_score = weighted_sum / total_candidates if total_candidates > 0 else 0
+    stats = single_group_stats(KHOI_SCORE_GRID, y, KHOI_THRESHOLDS, KHOI_MAX_SCORE)
+    total_candidates = int(stats['total_candidates'])
     
     # Prepare Highest Score String
     highest_score_str = ""
@@ -176,96 +99,18 @@ def generate_khoi_chart(group_df, year, khoi, high_score_data=None):
         highest_score_str = f"Điểm cao nhất: {h_score:.2f} ({int(h_count)} thí sinh)\n\n"
     
     # Percentile / Z-Score Logic
-    z_defs = [
-        (3,  "99.87", 0.9987),
-        (2,  "97.72", 0.9772),
-        (1,  "84.13", 0.8413),
-        (0,  "50",    0.5000),
-        (-1, "15.87", 0.1587),
-        (-2, "2.28",  0.0228),
-        (-3, "0.13",  0.0013)
-    ]
-    
     z_stats_text = ""
-    for z, label_pct, prob in z_defs:
-        target_cum = total_candidates * (1.0 - prob)
-        val = find_score_at_percentile(df_merged, target_cum, score_col_name='min_score')
+    for z, label_pct, _ in Z_SCORE_DEFS:
         sign = "+" if z > 0 else ""
-        z_stats_text += f"  Độ lệch chuẩn {sign}{z} (Top {label_pct}%): {val:.2f}\n"
+        z_stats_text += f"  Độ lệch chuẩn {sign}{z} (Top {label_pct}%): {stats[z_stat_name(z)]:.2f}\n"
 
     # Specific Counts & Percentages
-    def get_count_stats(threshold, is_exact=False):
-        if is_exact:
-            cnt = df_merged[df_merged['min_score'] == threshold]['count'].sum()
-        else:
-            cnt = df_merged[df_merged['min_score'] >= threshold]['count'].sum()
-        pct = (100 - cnt / total_candidates * 100) if total_candidates > 0 else 0
-        return cnt, pct
-
-    c15, p15 = get_count_stats(15)
-    c18, p18 = get_count_stats(18)
-    c21, p21 = get_count_stats(21)
-    c24, p24 = get_count_stats(24)
-    c27, p27 = get_count_stats(27)
-    c30, p30 = get_count_stats(30, is_exact=True)
-
-    # 3. Setup Figure
-    fig, ax = plt.subplots(figsize=FIG_SIZE, dpi=DPI)
-    
-    y_axis_max = max_count * 4 / 3
-    ax.set_ylim(0, y_axis_max)
-    ax.set_xlim(-0.1, 30.1)
-    
-    # 4. Color Gradient
-    cmap = create_custom_colormap()
-    norm = mcolors.Normalize(vmin=0, vmax=30)
-    colors = cmap(norm(x))
-    
-    # 5. Plot Bars
-    rects = ax.bar(x, y, width=0.2, color=colors, align='center', zorder=3)
-    
-    # Labels
-    label_threshold = y_axis_max * 0.05
-    label_font_size = 9 * SCALE_H
-    
-    for rect, val in zip(rects, y):
-        if val == 0: continue
-        height = rect.get_height()
-        label_str = f"{int(val):,}"
-        
-        if height > label_threshold:
-            y_pos = y_axis_max * 0.005 
-            va = 'bottom'
-            text_color = 'black' 
-        else:
-            y_pos = height + (y_axis_max * 0.005)
-            va = 'bottom'
-            text_color = 'black'
-            
-        ax.text(rect.get_x() + rect.get_width() / 2, y_pos, label_str, 
-                ha='center', va=va, rotation=90, fontsize=label_font_size, color=text_color, zorder=4)
-
-    # 6. Axes
-    step = get_y_tick_step(y_axis_max)
-    y_ticks = np.arange(0, y_axis_max + (step*0.1), step)
-    y_ticks = y_ticks[y_ticks <= y_axis_max * 1.05]
-    ax.set_yticks(y_ticks)
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda x, p: format(int(x), ',')))
-    
-    ax.set_xticks(all_scores)
-    xtick_labels = [f"{v:g}" for v in all_scores]
-    ax.set_xticklabels(xtick_labels, rotation=90, fontsize=9 * SCALE_H)
-
-    # 7. Styling
-    ax.grid(True, which='major', axis='both', linestyle='-', linewidth=0.5 * SCALE_W, alpha=0.6, color='#555555', zorder=0)
-    
-    title_fs = 32 * SCALE_H
-    label_fs = 20 * SCALE_H
-    tick_fs = 14 * SCALE_H
-    legend_fs = 12 * SCALE_H 
-    
-    ax.tick_params(axis='y', labelsize=tick_fs)
+    count_lines = [f"  Điểm ≥ {t}: {int(stats[f'count_ge_{t}']):,} (Top {stats[f'top_pct_ge_{t}']:.2f}%)\n"
+                   for t in KHOI_THRESHOLDS]
+    count_lines.append(f"  Điểm = {KHOI_MAX_SCORE}: {int(stats[f'count_eq_{KHOI_MAX_SCORE}']):,} "
+                       f"(Top {stats[f'top_pct_eq_{KHOI_MAX_SCORE}']:.2f}%)")
 
+    # 3. Title
     year_int = int(year)
     if year_int <= 2014:
         title_text = f"Biểu đồ phổ điểm thi Đại học khối {khoi} năm {year}"
@@ -274,165 +119,69 @@ def generate_khoi_chart(group_df, year, khoi, high_score_data=None):
     else: 
         title_text = f"Biểu đồ phổ điểm thi Tốt nghiệp THPT khối {khoi} năm {year}"
 
-    plt.title(title_text, fontsize=title_fs, fontweight='bold', pad=35 * SCALE_H)
-    ax.set_xlabel("Khoảng điểm", fontsize=label_fs, labelpad=25 * SCALE_H)
-    ax.set_ylabel("Số lượng thí sinh", fontsize=label_fs, labelpad=35 * SCALE_H)
-    ax.text(0, 1.01, f"Số lượng thí sinh: {total_candidates:,}", 
-            transform=ax.transAxes, fontsize=label_fs, fontweight='bold', va='bottom', ha='left')
-
     # Legend
     legend_text = (
         f"Các tham số đặc trưng:\n"
         f"─────────────────────\n"
-        f"Điểm trung bình: {avg_score:.2f}\n\n"
+        f"Điểm trung bình: {stats['mean_score']:.2f}\n\n"
         f"{highest_score_str}"
         f"{z_stats_text}\n"
         f"Số lượng thí sinh:\n"
-        f"  Điểm ≥ 15: {int(c15):,} (Top {p15:.2f}%)\n"
-        f"  Điểm ≥ 18: {int(c18):,} (Top {p18:.2f}%)\n"
-        f"  Điểm ≥ 21: {int(c21):,} (Top {p21:.2f}%)\n"
-        f"  Điểm ≥ 24: {int(c24):,} (Top {p24:.2f}%)\n"
-        f"  Điểm ≥ 27: {int(c27):,} (Top {p27:.2f}%)\n"
-        f"  Điểm = 30: {int(c30):,} (Top {p30:.2f}%)"
+        + "".join(count_lines)
     )
     
-    props = dict(boxstyle='square,pad=1', facecolor='white', alpha=0.75, edgecolor='black', linewidth=2 * SCALE_W)
-    ax.text(0.02, 0.98, legend_text, transform=ax.transAxes, fontsize=legend_fs,
-            verticalalignment='top', horizontalalignment='left', bbox=props, zorder=5)
+    # 4. Draw & Save
+    import score_dist_drawing as drawing
+    owns_template = templates is None
+    if owns_template:
+        template = drawing.khoi_chart_template()
+    else:
+        template = drawing.get_chart_template(templates, ('khoi',), drawing.khoi_chart_template)
+    drawing.fill_chart_template(template, y, title_text, total_candidates, legend_text)
 
-    plt.subplots_adjust(top=0.90, bottom=0.12, left=0.08, right=0.96)
-    filename_base = f"score_dist_{year}_{khoi}"
     print(f"[Khoi] Saving {filename_base}...")
-    plt.savefig(f"{filename_base}.svg", format='svg')
-    plt.savefig(f"{filename_base}.png", format='png', dpi=DPI)
-    plt.close(fig)
+    drawing.save_chart_template(template, filename_base, formats)
+    if owns_template:
+        drawing.close_chart_template(template)
+    record_chart(manifest, filename_base, digest, formats)
+    return chart_output_files(filename_base, formats)
 
 # --- PART 2: MON (SUBJECT) CHART GENERATION ---
 
-def generate_subject_chart(data_df, year, subject, khoi_label, step):
-    # 1. Process Data
-    grouped_df = process_data_binning(data_df, step)
+def generate_subject_chart(data_df, year, subject, khoi_label, step, manifest=None, templates=None,
+                           formats=CHART_FORMATS):
+    """Draws one subject chart; returns the written file paths (empty if up to date or without data)."""
+    filename_base = subject_chart_basename(year, subject, khoi_label)
+    digest = subject_chart_digest(data_df, year, subject, khoi_label, step)
+    if chart_is_up_to_date(manifest, filename_base, digest, formats):
+        print(f"[Subject] Up to date: {filename_base}")
+        return []
     
-    num_steps = int(10.0 / step) + 1
-    all_scores = np.linspace(0, 10, num_steps)
-    all_scores = np.round(all_scores, 3)
-    
-    df_grid = pd.DataFrame({'score': all_scores})
-    df_merged = pd.merge(df_grid, grouped_df, on='score', how='left')
-    df_merged['count'] = df_merged['count'].fillna(0)
-    df_merged = df_merged.sort_values(by='score', ascending=True)
-
-    x = df_merged['score'].values
-    y = df_merged['count'].values
+    # 1. Process Data
+    all_scores, y = process_data_binning(data_df, step)
     
     max_count = y.max()
     if max_count <= 0:
         print(f"[Subject] Skipping {year} {subject}: No data.")
-        return
+        return []
 
-    total_candidates = int(df_merged['count'].sum())
-    
     # 2. Statistics
-    weighted_sum = np.sum(x * y)
-    avg_score = weighted_sum / total_candidates if total_candidates > 0 else 0
-    
-    max_score_row = df_merged[df_merged['count'] > 0].iloc[-1]
-    max_score_val = max_score_row['score']
-    max_score_count = int(max_score_row['count'])
-    highest_score_str = f"Điểm cao nhất: {max_score_val:g} ({max_score_count} thí sinh)\n\n"
+    stats = single_group_stats(all_scores, y, SUBJECT_THRESHOLDS, SUBJECT_MAX_SCORE)
+    total_candidates = int(stats['total_candidates'])
     
-    z_defs = [
-        (3,  "99.87", 0.9987),
-        (2,  "97.72", 0.9772),
-        (1,  "84.13", 0.8413),
-        (0,  "50",    0.5000),
-        (-1, "15.87", 0.1587),
-        (-2, "2.28",  0.0228),
-        (-3, "0.13",  0.0013)
-    ]
+    highest_score_str = f"Điểm cao nhất: {stats['max_score']:g} ({int(stats['max_score_count'])} thí sinh)\n\n"
     
     z_stats_text = ""
-    for z, label_pct, prob in z_defs:
-        target_cum = total_candidates * (1.0 - prob)
-        val = find_score_at_percentile(df_merged, target_cum, score_col_name='score')
+    for z, label_pct, _ in Z_SCORE_DEFS:
         sign = "+" if z > 0 else ""
-        z_stats_text += f"  Độ lệch chuẩn {sign}{z} (Top {label_pct}%): {val:g}\n"
+        z_stats_text += f"  Độ lệch chuẩn {sign}{z} (Top {label_pct}%): {stats[z_stat_name(z)]:g}\n"
 
-    def get_count_stats(threshold, is_exact=False):
-        if is_exact:
-            cnt = df_merged[np.isclose(df_merged['score'], threshold)]['count'].sum()
-        else:
-            cnt = df_merged[df_merged['score'] >= (threshold - 0.001)]['count'].sum()
-        pct = (100 - cnt / total_candidates * 100) if total_candidates > 0 else 0
-        return cnt, pct
-
-    c5, p5 = get_count_stats(5)
-    c6, p6 = get_count_stats(6)
-    c7, p7 = get_count_stats(7)
-    c8, p8 = get_count_stats(8)
-    c9, p9 = get_count_stats(9)
-    c10, p10 = get_count_stats(10, is_exact=True)
-
-    # 3. Setup Figure
-    fig, ax = plt.subplots(figsize=FIG_SIZE, dpi=DPI)
-    
-    y_axis_max = max_count * 4 / 3
-    ax.set_ylim(0, y_axis_max)
-    ax.set_xlim(-0.1, 10.1)
-    
-    # 4. Color Gradient
-    cmap = create_custom_colormap()
-    norm = mcolors.Normalize(vmin=0, vmax=10)
-    colors = cmap(norm(x))
-    
-    # 5. Plot Bars
-    rects = ax.bar(x, y, width=step*0.8, color=colors, align='center', zorder=3)
-    
-    # Labels
-    label_threshold = y_axis_max * 0.05
-    label_font_size = 9 * SCALE_H
-    
-    for rect, val in zip(rects, y):
-        if val == 0: continue
-        height = rect.get_height()
-        label_str = f"{int(val):,}"
-        
-        if height > label_threshold:
-            y_pos = y_axis_max * 0.005 
-            va = 'bottom'
-            text_color = 'black' 
-        else:
-            y_pos = height + (y_axis_max * 0.005)
-            va = 'bottom'
-            text_color = 'black'
-            
-        ax.text(rect.get_x() + rect.get_width() / 2, y_pos, label_str, 
-                ha='center', va=va, rotation=90, fontsize=label_font_size, color=text_color, zorder=4)
-
-    # 6. Axes
-    y_step = get_y_tick_step(y_axis_max)
-    y_ticks = np.arange(0, y_axis_max + (y_step*0.1), y_step)
-    y_ticks = y_ticks[y_ticks <= y_axis_max * 1.05]
-    ax.set_yticks(y_ticks)
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda x, p: format(int(x), ',')))
-    
-    ax.set_xticks(all_scores)
-    xtick_labels = [f"{v:g}" for v in all_scores]
-    rotation = 90
-    font_size_x = 9 * SCALE_H
-    if step < 0.25: font_size_x = 8 * SCALE_H
-    ax.set_xticklabels(xtick_labels, rotation=rotation, fontsize=font_size_x)
-
-    # 7. Styling
-    ax.grid(True, which='major', axis='both', linestyle='-', linewidth=0.5 * SCALE_W, alpha=0.3, color='#555555', zorder=0)
-    
-    title_fs = 32 * SCALE_H
-    label_fs = 20 * SCALE_H
-    tick_fs = 14 * SCALE_H
-    legend_fs = 12 * SCALE_H 
-    
-    ax.tick_params(axis='y', labelsize=tick_fs)
+    count_lines = [f"  Điểm ≥ {t}: {int(stats[f'count_ge_{t}']):,} (Top {stats[f'top_pct_ge_{t}']:.2f}%)\n"
+                   for t in SUBJECT_THRESHOLDS]
+    count_lines.append(f"  Điểm = {SUBJECT_MAX_SCORE}: {int(stats[f'count_eq_{SUBJECT_MAX_SCORE}']):,} "
+                       f"(Top {stats[f'top_pct_eq_{SUBJECT_MAX_SCORE}']:.2f}%)")
 
+    # 3. Title
     year_int = int(year)
     subject_vn = SUBJECT_NAME_MAP.get(subject, subject)
     if year_int <= 2014:
@@ -442,111 +191,237 @@ def generate_subject_chart(data_df, year, subject, khoi_label, step):
     else:
         title_text = f"Biểu đồ phổ điểm thi Tốt nghiệp THPT môn {subject_vn} năm {year}"
 
-    plt.title(title_text, fontsize=title_fs, fontweight='bold', pad=35 * SCALE_H)
-    ax.set_xlabel("Điểm số", fontsize=label_fs, labelpad=25 * SCALE_H)
-    ax.set_ylabel("Số lượng thí sinh", fontsize=label_fs, labelpad=35 * SCALE_H)
-    ax.text(0, 1.01, f"Số lượng thí sinh: {total_candidates:,}", 
-            transform=ax.transAxes, fontsize=label_fs, fontweight='bold', va='bottom', ha='left')
-
     # Legend
     legend_text = (
         f"Các tham số đặc trưng:\n"
         f"─────────────────────\n"
-        f"Điểm trung bình: {avg_score:.2f}\n\n"
+        f"Điểm trung bình: {stats['mean_score']:.2f}\n\n"
         f"{highest_score_str}"
         f"{z_stats_text}\n"
         f"Số lượng thí sinh:\n"
-        f"  Điểm ≥ 5: {int(c5):,} (Top {p5:.2f}%)\n"
-        f"  Điểm ≥ 6: {int(c6):,} (Top {p6:.2f}%)\n"
-        f"  Điểm ≥ 7: {int(c7):,} (Top {p7:.2f}%)\n"
-        f"  Điểm ≥ 8: {int(c8):,} (Top {p8:.2f}%)\n"
-        f"  Điểm ≥ 9: {int(c9):,} (Top {p9:.2f}%)\n"
-        f"  Điểm = 10: {int(c10):,} (Top {p10:.2f}%)"
+        + "".join(count_lines)
     )
     
-    props = dict(boxstyle='square,pad=1', facecolor='white', alpha=0.75, edgecolor='black', linewidth=2 * SCALE_W)
-    ax.text(0.02, 0.98, legend_text, transform=ax.transAxes, fontsize=legend_fs,
-            verticalalignment='top', horizontalalignment='left', bbox=props, zorder=5)
-
-    plt.subplots_adjust(top=0.90, bottom=0.12, left=0.08, right=0.96)
-    
-    if year_int <= 2014:
-        filename_base = f"score_dist_mon_{year}_{subject}_{khoi_label}"
+    # 4. Draw & Save
+    import score_dist_drawing as drawing
+    owns_template = templates is None
+    if owns_template:
+        template = drawing.subject_chart_template(step)
     else:
-        filename_base = f"score_dist_mon_{year}_{subject}"
+        template = drawing.get_chart_template(templates, ('subject', step), lambda: drawing.subject_chart_template(step))
+    drawing.fill_chart_template(template, y, title_text, total_candidates, legend_text)
 
     print(f"[Subject] Saving {filename_base}...")
-    plt.savefig(f"{filename_base}.svg", format='svg')
-    plt.savefig(f"{filename_base}.png", format='png', dpi=DPI)
-    plt.close(fig)
+    drawing.save_chart_template(template, filename_base, formats)
+    if owns_template:
+        drawing.close_chart_template(template)
+    record_chart(manifest, filename_base, digest, formats)
+    return chart_output_files(filename_base, formats)
 
 # --- EXECUTION LOGIC ---
 
-def process_khoi_logic():
-    input_csv = 'matplotlib_score_dist_preprocess_khoi_test.csv'
-    highest_score_csv = 'highest_score.csv'
-    
-    if not os.path.exists(input_csv):
-        print(f"Skipping Khoi (Group) processing: {input_csv} not found.")
-        return
-
-    print("--- Processing Khoi (Group) Data ---")
-    df = pd.read_csv(input_csv)
-    
-    if os.path.exists(highest_score_csv):
-        df_high = pd.read_csv(highest_score_csv)
-    else:
-        print(f"Warning: {highest_score_csv} not found. Charts will miss highest score info.")
-        df_high = pd.DataFrame(columns=['year', 'khoi', 'highest_score', 'so_luong'])
+def list_khoi_jobs(df, df_high):
+    """One job per (year, khoi) in the khoi distribution data, with its highest-score rows."""
+    if df is None:
+        return []
 
-    combinations = df[['year', 'khoi']].drop_duplicates().values
+    # Partition both frames once; each (year, khoi) slice goes straight into its job
+    high_by_group = dict(iter(df_high.groupby(['year', 'khoi'], observed=True, sort=False)))
+    no_high_score = df_high.iloc[0:0]
 
-    for year, khoi in combinations:
-        group_data = df[(df['year'] == year) & (df['khoi'] == khoi)].copy()
-        high_score_row = df_high[(df_high['year'] == year) & (df_high['khoi'] == khoi)]
+    jobs = []
+    for (year, khoi), group_data in df.groupby(['year', 'khoi'], observed=True, sort=False):
+        group_data = group_data.copy()
         group_data['count'] = pd.to_numeric(group_data['count'], errors='coerce').fillna(0)
-        generate_khoi_chart(group_data, year, khoi, high_score_row)
-
-def process_subject_logic():
-    input_csv = 'matplotlib_score_dist_preprocess_mon_test.csv'
-    
-    if not os.path.exists(input_csv):
-        print(f"Skipping Subject (Mon) processing: {input_csv} not found.")
-        return
-
-    print("--- Processing Subject (Mon) Data ---")
-    df = pd.read_csv(input_csv)
-    df['Year'] = pd.to_numeric(df['Year'], errors='coerce')
-    df = df.dropna(subset=['Year'])
-    df['Year'] = df['Year'].astype(int)
-
-    unique_years = sorted(df['Year'].unique())
-
-    for year in unique_years:
-        year_df = df[df['Year'] == year]
-        subjects = year_df['Subject'].unique()
+        jobs.append({
+            'kind': 'khoi',
+            'year': int(year),
+            'khoi': khoi,
+            'data': group_data,
+            'high': high_by_group.get((year, khoi), no_high_score)
+        })
+    return jobs
+
+def list_subject_jobs(df):
+    """One job per (year, subject), or per (year, subject, khoi) up to 2014, in the subject data."""
+    if df is None:
+        return []
+
+    # Partition once by (year, subject); charts run in year order, subjects in order of appearance
+    subject_groups = sorted(df.groupby(['Year', 'Subject'], observed=True, sort=False), key=lambda item: item[0][0])
+
+    jobs = []
+    for (year, subject), subject_df in subject_groups:
+        step = get_step_size(year, subject)
+        if step is None: continue
         
-        for subject in subjects:
-            step = get_step_size(year, subject)
-            if step is None: continue
-            
-            subject_df = year_df[year_df['Subject'] == subject]
-            
-            # Logic for older years (<=2014) where subjects were split by Khoi
-            if year <= 2014:
-                unique_khois = subject_df['khoi'].unique()
-                for khoi in unique_khois:
-                    if pd.isna(khoi): continue
-                    data_subset = subject_df[subject_df['khoi'] == khoi]
-                    generate_subject_chart(data_subset, year, subject, khoi, step)
-            else:
-                generate_subject_chart(subject_df, year, subject, "", step)
-
-def main():
-    process_khoi_logic()
-    print("\n")
-    process_subject_logic()
-    print("\nAll processing complete.")
+        # Logic for older years (<=2014) where subjects were split by Khoi
+        if year <= 2014:
+            slices = list(subject_df.groupby('khoi', observed=True, sort=False))
+        else:
+            slices = [("", subject_df)]
+        for khoi_label, data_subset in slices:
+            jobs.append({
+                'kind': 'subject',
+                'year': int(year),
+                'subject': subject,
+                'khoi_label': khoi_label,
+                'step': step,
+                'data': data_subset
+            })
+    return jobs
+
+def chart_job_name(job):
+    if job['kind'] == 'khoi':
+        return khoi_chart_basename(job['year'], job['khoi'])
+    return subject_chart_basename(job['year'], job['subject'], job['khoi_label'])
+
+def chart_job_digest(job):
+    if job['kind'] == 'khoi':
+        return khoi_chart_digest(job['data'], job['year'], job['khoi'], job['high'])
+    return subject_chart_digest(job['data'], job['year'], job['subject'], job['khoi_label'], job['step'])
+
+# --- PARALLEL RENDERING ---
+
+# Chart templates owned by a worker process, set up by _init_chart_worker()
+_worker_templates = None
+
+def _init_chart_worker(use_templates=True, steps=()):
+    """Per-process warm-up: Agg backend, font lookup and the chart templates for the given steps."""
+    global _worker_templates
+    import score_dist_drawing as drawing
+    drawing.init_drawing()
+    _worker_templates = {} if use_templates else None
+    if _worker_templates is not None:
+        drawing.get_chart_template(_worker_templates, ('khoi',), drawing.khoi_chart_template)
+        for step in steps:
+            drawing.get_chart_template(_worker_templates, ('subject', step),
+                                       lambda: drawing.subject_chart_template(step))
+
+def _render_chart_job(job, templates=None, formats=CHART_FORMATS):
+    """Renders one chart job and reports the outcome instead of raising."""
+    start = time.perf_counter()
+    outputs = []
+    try:
+        if job['kind'] == 'khoi':
+            outputs = generate_khoi_chart(job['data'], job['year'], job['khoi'], job['high'], templates=templates,
+                                          formats=formats)
+        else:
+            outputs = generate_subject_chart(job['data'], job['year'], job['subject'], job['khoi_label'], job['step'],
+                                             templates=templates, formats=formats)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return chart_job_result(job, error, outputs, time.perf_counter() - start)
+
+def chart_job_result(job, error=None, outputs=(), seconds=0.0):
+    return {
+        'kind': job['kind'],
+        'year': job['year'],
+        'name': chart_job_name(job),
+        'ok': error is None,
+        'error': error,
+        'outputs': list(outputs),
+        # Jobs render without a manifest, so a successful job that wrote nothing had no data
+        'no_data': error is None and not outputs,
+        'seconds': seconds
+    }
+
+def _render_chart_job_in_worker(job, formats):
+    return _render_chart_job(job, _worker_templates, formats)
+
+def render_chart_batch(jobs, workers=None, use_templates=True, formats=CHART_FORMATS):
+    """
+    Renders chart jobs across a pool of worker processes, each with its own chart templates.
+    workers=1 renders in this process. Returns one result dict per job (name, outputs, seconds,
+    error) in job order; failures are collected, not raised, including jobs lost with a
+    worker process that died (e.g. killed for running out of memory).
+    """
+    # Every forked worker carries the parent's data and builds templates, so never start more than there are jobs
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    
+    if workers == 1:
+        templates = {} if use_templates else None
+        results = [_render_chart_job(job, templates, formats) for job in jobs]
+        if templates is not None:
+            import score_dist_drawing as drawing
+            drawing.close_chart_templates(templates)
+        return results
+
+    steps = sorted({job['step'] for job in jobs if job['kind'] == 'subject'})
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_worker,
+                             initargs=(use_templates, steps)) as pool:
+        futures = {pool.submit(_render_chart_job_in_worker, job, formats): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception:
+                # A dead worker breaks the pool: its job and every pending one fail here
+                results[i] = chart_job_result(jobs[i], traceback.format_exc())
+    return results
+
+def main(force=False, use_templates=True, formats=CHART_FORMATS,
+         workers=None, stats_only=False, stats_output=STATS_OUTPUT_PATH, inputs=None):
+    """
+    Renders every khoi and subject chart whose inputs changed; returns the per-job results.
+    stats_only writes the legend statistics of every chart to stats_output instead and renders nothing.
+    inputs: chart input frames as returned by load_chart_inputs() (read from the CSVs when None).
+    """
+    if inputs is None:
+        inputs = load_chart_inputs()
+
+    if stats_only:
+        start = time.perf_counter()
+        write_stats_table(compute_stats_table(inputs), stats_output)
+        print(f"Statistics computed in {time.perf_counter() - start:.2f}s")
+        return []
+
+    manifest = load_manifest(MANIFEST_PATH)
+
+    all_jobs = list_khoi_jobs(inputs['khoi'], inputs['highest_score']) + list_subject_jobs(inputs['subject'])
+
+    # Charts whose data slice and parameters match the manifest are skipped before dispatch;
+    # force only bypasses the check, entries for other formats stay in the manifest
+    digests = {chart_job_name(job): chart_job_digest(job) for job in all_jobs}
+    jobs = [job for job in all_jobs
+            if force or not chart_is_up_to_date(manifest, chart_job_name(job), digests[chart_job_name(job)], formats)]
+    print(f"Up to date: {len(all_jobs) - len(jobs)} charts. "
+          f"Rendering {len(jobs)} charts with {min(workers or os.cpu_count() or 1, max(len(jobs), 1))} worker(s)")
+
+    render_start = time.perf_counter()
+    results = render_chart_batch(jobs, workers=workers, use_templates=use_templates, formats=formats)
+
+    for r in results:
+        if r['ok']:
+            record_chart(manifest, r['name'], digests[r['name']], formats, no_data=r['no_data'])
+    save_manifest(manifest, MANIFEST_PATH)
+
+    failed = [r for r in results if not r['ok']]
+    for r in failed:
+        print(f"Error processing {r['name']}:\n{r['error']}")
+
+    written = sum(1 for r in results if r['outputs'])
+    print(f"\nAll processing complete. {written} charts written, {len(failed)} failed "
+          f"in {time.perf_counter() - render_start:.2f}s")
+    return results
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate khoi and subject score-distribution charts.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Rebuild every chart even if its inputs are unchanged.")
+    parser.add_argument('--no-templates', action='store_true', help="Build a fresh figure for every chart.")
+    parser.add_argument('--formats', nargs='+', choices=CHART_FORMATS, default=list(CHART_FORMATS),
+                        help="Output formats to write for every chart (default: svg png).")
+    parser.add_argument('--stats-only', action='store_true',
+                        help="Only write the chart statistics table (no rendering).")
+    parser.add_argument('--stats-output', default=STATS_OUTPUT_PATH,
+                        help="Statistics table for --stats-only, .csv or .parquet (default: %(default)s)")
+    args = parser.parse_args()
+    results = main(force=args.force, use_templates=not args.no_templates,
+                   formats=tuple(args.formats), workers=args.workers, stats_only=args.stats_only,
+                   stats_output=args.stats_output)
+    if any(not r['ok'] for r in results):
+        sys.exit(1)
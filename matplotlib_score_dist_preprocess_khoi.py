@@ -1,6 +1,10 @@
 import openpyxl
 import csv
-import sys
+import argparse
+import pandas as pd
+
+from score_iq import below_proportions, iq15_values
+from workbook_cache import load_parsed_workbook
 
 def parse_score_range(score_str):
     if isinstance(score_str, (int, float)):
@@ -11,82 +15,124 @@ def parse_score_range(score_str):
     else:
         raise ValueError(f"Invalid score range: {score_str}")
 
-def main(input_file, output_file):
-    wb = openpyxl.load_workbook(input_file, data_only=True)
-    sheet = wb.active
+KHOI_LIST = ['A', 'A1', 'B', 'C', 'D']
+KHOI_COLUMNS = ['max_score', 'min_score', 'year', 'khoi', 'count', 'cumulative']
+# Bump when the parsed table changes, so cached workbook tables are rebuilt
+KHOI_PARSER_VERSION = 1
+FIRST_YEAR_COL = 1  # 0-based: years and counts start in sheet column B
+
+def is_year(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return float(value).is_integer()
+    return isinstance(value, str) and value.strip().isdigit()
+
+def header_years(values):
+    """Years of a khoi header row: the year cells from column B up to the first other cell (e.g. the '2013-2025' total)."""
+    years = []
+    for value in values[FIRST_YEAR_COL:]:
+        if not is_year(value):
+            break
+        years.append(value)
+    return years
+
+def is_section_end(score_str):
+    return score_str is None or (isinstance(score_str, str) and (score_str.startswith('Tổng') or score_str.startswith('Điểm')))
+
+def iter_khoi_sections(rows):
+    """
+    One forward pass over the sheet's row values (tuples). Yields (khoi, years, data_rows) for
+    every khoi section: a khoi header row, then score-range rows until a total/empty/unparsable row.
+    data_rows holds (max_sc, min_sc, counts) with one count per year.
+    """
+    section = None
+    for values in rows:
+        first = values[0] if values else None
+        if section is not None:
+            khoi, years, data_rows = section
+            if not is_section_end(first):
+                try:
+                    max_sc, min_sc = parse_score_range(first)  # Note: max first as per user (highest in range)
+                except ValueError:
+                    pass  # Not a score range: the section ends here
+                else:
+                    cells = values[FIRST_YEAR_COL:FIRST_YEAR_COL + len(years)]
+                    cells = tuple(cells) + (None,) * (len(years) - len(cells))
+                    counts = [int(cnt) if cnt is not None else 0 for cnt in cells]  # Assume counts are integers
+                    data_rows.append((max_sc, min_sc, counts))
+                    continue
+            yield section
+            section = None
+
+        # The row that ended a section may itself start the next one
+        if first in KHOI_LIST:
+            years = header_years(values)
+            if not years:
+                raise ValueError(f"No year columns found for khoi {first}")
+            section = (first, years, [])
 
-    khoi_list = ['A', 'A1', 'B', 'C', 'D']
-    years_count = 13  # 2025 to 2013
+    if section is not None:
+        yield section
 
+def parse_khoi_workbook(input_file):
+    """
+    Long table of every khoi section in sheet order (range by range, year by year):
+    KHOI_COLUMNS plus IQ15, the IQ-scaled share of candidates below each range in its year.
+    """
+    # Read-only mode streams the rows instead of building every cell object up front
+    wb = openpyxl.load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        sections = list(iter_khoi_sections(wb.active.iter_rows(values_only=True)))
+    finally:
+        wb.close()
+
+    rows = []
+    for khoi, years, data_rows in sections:
+        years_count = len(years)
+
+        # Compute cumulatives for each year
+        num_ranges = len(data_rows)
+        if num_ranges == 0:
+            continue
+        cumuls = [[0] * num_ranges for _ in range(years_count)]
+        for y_idx in range(years_count):
+            current_sum = 0
+            for rng_idx in range(num_ranges):
+                current_sum += data_rows[rng_idx][2][y_idx]
+                cumuls[y_idx][rng_idx] = current_sum
+
+        # One batched IQ15 column per year; the last cumulative is the year's total
+        iq15 = [iq15_values(below_proportions(cumuls[y_idx], cumuls[y_idx][-1]))
+                for y_idx in range(years_count)]
+
+        for rng_idx in range(num_ranges):
+            max_sc, min_sc, counts = data_rows[rng_idx]
+            for y_idx, year in enumerate(years):
+                rows.append([max_sc, min_sc, year, khoi, counts[y_idx], cumuls[y_idx][rng_idx], iq15[y_idx][rng_idx]])
+
+    return pd.DataFrame(rows, columns=KHOI_COLUMNS + ['IQ15'])
+
+def write_khoi_csv(table, output_file, with_iq15=False):
+    columns = KHOI_COLUMNS + ['IQ15'] if with_iq15 else KHOI_COLUMNS
     with open(output_file, 'w', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow(['max_score', 'min_score', 'year', 'khoi', 'count', 'cumulative'])
-
-        row = 1
-        while row <= sheet.max_row:
-            cell_value = sheet.cell(row, 1).value
-            if cell_value in khoi_list:
-                khoi = cell_value
-                years = []
-                for col in range(2, 2 + years_count):
-                    year = sheet.cell(row, col).value
-                    if year:
-                        years.append(year)
-                if len(years) != years_count:
-                    raise ValueError(f"Unexpected number of years for khoi {khoi}")
-
-                data_rows = []
-                r = row + 1
-                while r <= sheet.max_row:
-                    score_str = sheet.cell(r, 1).value
-                    if score_str is None or (isinstance(score_str, str) and (score_str.startswith('Tổng') or score_str.startswith('Điểm'))):
-                        break
-
-                    try:
-                        max_sc, min_sc = parse_score_range(score_str)  # Note: max first as per user (highest in range)
-                    except ValueError:
-                        break  # Skip if not parsable
-
-                    counts = []
-                    for col in range(2, 2 + years_count):
-                        cnt = sheet.cell(r, col).value
-                        if cnt is None:
-                            cnt = 0
-                        counts.append(int(cnt))  # Assume counts are integers
+        writer.writerow(columns)
+        writer.writerows(table[columns].itertuples(index=False, name=None))
 
-                    data_rows.append((max_sc, min_sc, counts))
-                    r += 1
-
-                # Compute cumulatives for each year
-                num_ranges = len(data_rows)
-                if num_ranges > 0:
-                    cumuls = [[0] * num_ranges for _ in range(years_count)]
-                    for y_idx in range(years_count):
-                        current_sum = 0
-                        for rng_idx in range(num_ranges):
-                            current_sum += data_rows[rng_idx][2][y_idx]
-                            cumuls[y_idx][rng_idx] = current_sum
-
-                    # Write to CSV
-                    for rng_idx in range(num_ranges):
-                        max_sc, min_sc, counts = data_rows[rng_idx]
-                        for y_idx, year in enumerate(years):
-                            count = counts[y_idx]
-                            cumul = cumuls[y_idx][rng_idx]
-                            writer.writerow([max_sc, min_sc, year, khoi, count, cumul])
-
-                # Skip to next section
-                row = r
-                while row <= sheet.max_row:
-                    next_value = sheet.cell(row, 1).value
-                    if next_value in khoi_list or next_value is None:
-                        break
-                    row += 1
-            else:
-                row += 1
+def main(input_file, output_file, with_iq15=False, use_cache=True):
+    """
+    Writes the long khoi CSV; with_iq15 adds the IQ15 column.
+    The parsed table is cached next to the workbook (see workbook_cache), so an unchanged workbook is not re-read.
+    """
+    table = load_parsed_workbook(input_file, parse_khoi_workbook, KHOI_PARSER_VERSION, use_cache)
+    write_khoi_csv(table, output_file, with_iq15)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python script.py input.xlsx output.csv")
-        sys.exit(1)
-    main(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert the khoi score distribution workbook to a long CSV.")
+    parser.add_argument('input', help="input.xlsx")
+    parser.add_argument('output', help="output.csv")
+    parser.add_argument('--iq15', action='store_true', help="Add an IQ15 column (as in the mon transformed.csv).")
+    parser.add_argument('--no-cache', action='store_true', help="Always re-parse the workbook, ignoring the parsed-workbook cache.")
+    args = parser.parse_args()
+    main(args.input, args.output, with_iq15=args.iq15, use_cache=not args.no_cache)
@@ -1,100 +1,99 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import norm
+import argparse
 
-# Load the Excel file
-df = pd.read_excel('mon_score_distribution_raw.xlsx', header=None)
+from score_iq import below_proportions, iq15_values
+from workbook_cache import load_parsed_workbook
 
-# Find start rows for each year
-start_rows = []
-years = []
-for row in range(len(df)):
-    val = df.iloc[row, 0]
-    if pd.notna(val) and str(val)[:4].isdigit() and int(str(val)[:4]) >= 2000:
-        years.append(int(val))
-        start_rows.append(row)
+# Every year block has five khoi column groups of three subjects; column 0 holds the scores
+KHOI_BLOCKS = [
+    ('A', [1, 2, 3]),
+    ('A1', [5, 6, 7]),
+    ('B', [9, 10, 11]),
+    ('C', [13, 14, 15]),
+    ('D', [17, 18, 19]),
+]
+OUTPUT_COLUMNS = ['Year', 'Subject', 'khoi_thi', 'Score', 'count', 'Cumulative', 'IQ15']
+# Bump when transform() output changes, so cached workbook tables are rebuilt
+MON_PARSER_VERSION = 1
 
-# Process each year
-output = []
-epsilon = 1e-9
-for idx, start in enumerate(start_rows):
-    year = years[idx]
-    header_row = start + 1
-    data_start = start + 2
-    # Find the total row
-    total_row = None
-    for r in range(data_start, len(df)):
-        if pd.isna(df.iloc[r, 0]):
-            total_row = r
-            break
-    if total_row is None:
-        continue
+def find_year_rows(df):
+    """(start row, year) of every year block: rows whose first cell starts with a year >= 2000."""
+    first_col = df[0]
+    prefix = first_col.astype(str).str[:4]
+    is_year = first_col.notna() & prefix.str.isdigit()
+    is_year &= pd.to_numeric(prefix.where(is_year), errors='coerce') >= 2000
+    return [(row, int(first_col.iloc[row])) for row in np.flatnonzero(is_year.to_numpy())]
 
-    # Define blocks using headers
-    blocks = [
-        {'khoi': 'A', 'subjects': [str(df.iloc[header_row, 1]), str(df.iloc[header_row, 2]), str(df.iloc[header_row, 3])], 'cols': [1, 2, 3]},
-        {'khoi': 'A1', 'subjects': [str(df.iloc[header_row, 5]), str(df.iloc[header_row, 6]), str(df.iloc[header_row, 7])], 'cols': [5, 6, 7]},
-        {'khoi': 'B', 'subjects': [str(df.iloc[header_row, 9]), str(df.iloc[header_row, 10]), str(df.iloc[header_row, 11])], 'cols': [9, 10, 11]},
-        {'khoi': 'C', 'subjects': [str(df.iloc[header_row, 13]), str(df.iloc[header_row, 14]), str(df.iloc[header_row, 15])], 'cols': [13, 14, 15]},
-        {'khoi': 'D', 'subjects': [str(df.iloc[header_row, 17]), str(df.iloc[header_row, 18]), str(df.iloc[header_row, 19])], 'cols': [17, 18, 19]},
-    ]
+def transform(df):
+    """
+    Long table (Year, Subject, khoi_thi, Score, count, Cumulative, IQ15) from the raw sheet.
+    Each year block is sliced as whole arrays: the score column and one count column per subject.
+    """
+    cells = df.to_numpy(dtype=object)
+    missing = pd.isna(cells)
+    columns = {name: [] for name in OUTPUT_COLUMNS if name != 'IQ15'}
+    proportions = []
 
-    # Process each block
-    for block in blocks:
-        for sub_idx, subject in enumerate(block['subjects']):
-            if pd.isna(subject) or subject == 'nan':
-                continue
-            col = block['cols'][sub_idx]
-            total = df.iloc[total_row, col]
-            if pd.isna(total) or total == 0:
-                continue
+    for start, year in find_year_rows(df):
+        header_row = start + 1
+        data_start = start + 2
+        # The block ends at the total row: the first row after the data with an empty score cell
+        gaps = np.flatnonzero(missing[data_start:, 0])
+        if len(gaps) == 0:
+            continue
+        total_row = data_start + gaps[0]
+        scores = cells[data_start:total_row, 0]
 
-            # Collect score to count
-            score_to_count = {}
-            for r in range(data_start, total_row):
-                score = df.iloc[r, 0]
-                count = df.iloc[r, col]
-                if pd.notna(score) and pd.notna(count):
-                    score_to_count[score] = count
+        for khoi, cols in KHOI_BLOCKS:
+            for col in cols:
+                subject = str(cells[header_row, col])
+                if subject == 'nan':
+                    continue
+                total = cells[total_row, col]
+                if pd.isna(total) or total == 0:
+                    continue
+
+                has_count = ~missing[data_start:total_row, col]
+                if not has_count.any():
+                    continue
+                block_scores = scores[has_count]
+                counts = cells[data_start:total_row, col][has_count]
+                # A repeated score keeps its last count
+                unique = ~pd.Series(block_scores).duplicated(keep='last').to_numpy()
+                block_scores = block_scores[unique]
+                counts = counts[unique]
 
-            if not score_to_count:
-                continue
+                # Highest score first; the cumulative count is the number of candidates at or above it
+                order = np.argsort(-block_scores.astype(float), kind='stable')
+                block_scores = block_scores[order]
+                counts = counts[order]
+                cumuls = np.cumsum(counts.astype(float))
 
-            # Sort scores descending
-            sorted_scores = sorted(score_to_count.keys(), reverse=True)
+                n = len(block_scores)
+                columns['Year'] += [year] * n
+                columns['Subject'] += [subject] * n
+                columns['khoi_thi'] += [khoi] * n
+                columns['Score'] += list(block_scores)
+                columns['count'] += list(counts)
+                columns['Cumulative'] += cumuls.tolist()
+                proportions.append(below_proportions(cumuls, total))
 
-            # Compute cumulatives (>= score)
-            cumuls = {}
-            current_cumul = 0.0
-            for s in sorted_scores:
-                current_cumul += score_to_count[s]
-                cumuls[s] = current_cumul
+    # IQ15 of every row in one batch
+    columns['IQ15'] = iq15_values(np.concatenate(proportions)) if proportions else []
+    return pd.DataFrame(columns)
 
-            # For each score, compute IQ15 using new method
-            for s in sorted_scores:
-                count = score_to_count[s]
-                cumul = cumuls[s]
-                if pd.isna(cumul) or pd.isna(count):
-                    continue
-                num_strictly_below = total - cumul
-                proportion = num_strictly_below / total if total > 0 else 0
-                if proportion > epsilon and proportion < (1.0 - epsilon):
-                    z = norm.ppf(proportion)
-                    iq_value = 100 + 15 * z
-                    iq = f"{iq_value:.7f}".rstrip('0').rstrip('.')
-                else:
-                    iq = '-'
-                output.append({
-                    'Year': year,
-                    'Subject': subject,
-                    'khoi_thi': block['khoi'],
-                    'Score': s,
-                    'count': count,
-                    'Cumulative': cumul,
-                    'IQ15': iq
-                })
+def parse_mon_workbook(input_file):
+    return transform(pd.read_excel(input_file, header=None))
+
+def main(input_file='mon_score_distribution_raw.xlsx', output_file='transformed.csv', use_cache=True):
+    """Writes transformed.csv; the parsed table is cached next to the workbook (see workbook_cache)."""
+    out_df = load_parsed_workbook(input_file, parse_mon_workbook, MON_PARSER_VERSION, use_cache)
+    out_df.to_csv(output_file, index=False)
+    print(f"CSV file '{output_file}' has been created.")
 
-# Create DataFrame and save to CSV
-out_df = pd.DataFrame(output)
-out_df.to_csv('transformed.csv', index=False)
-print("CSV file 'transformed.csv' has been created.")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the mon score distribution workbook to transformed.csv.")
+    parser.add_argument('--no-cache', action='store_true', help="Always re-parse the workbook, ignoring the parsed-workbook cache.")
+    args = parser.parse_args()
+    main(use_cache=not args.no_cache)
@@ -0,0 +1,198 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+import matplotlib.ticker as ticker
+from matplotlib.font_manager import FontProperties, findfont
+
+from score_dist_stats import KHOI_SCORE_GRID, KHOI_MAX_SCORE, subject_score_grid
+
+# Drawing side of the score-distribution charts: figure layout, bar value labels and the
+# reusable chart templates. matplotlib_score_dist_main imports this module only when it
+# renders, so its statistics, manifest and job code never load matplotlib.
+# Bump CHART_RENDER_VERSION in matplotlib_score_dist_main when the drawing here changes.
+
+# Use Agg backend for non-interactive image generation
+plt.switch_backend('Agg')
+
+# --- GLOBAL CONFIGURATION ---
+IMG_WIDTH_PX = 5000
+IMG_HEIGHT_PX = 2813
+DPI = 100
+FIG_SIZE = (IMG_WIDTH_PX / DPI, IMG_HEIGHT_PX / DPI)
+
+# Scaling factors
+SCALE_H = IMG_HEIGHT_PX / 1000 
+SCALE_W = IMG_WIDTH_PX / 1000
+
+# Font Configuration: Times New Roman
+plt.rcParams['font.family'] = 'serif'
+plt.rcParams['font.serif'] = ['Times New Roman']
+plt.rcParams['axes.unicode_minus'] = False
+
+# --- SHARED HELPER FUNCTIONS ---
+
+def get_y_tick_step(y_max):
+    """Calculates the Y-axis tick step (4-10 labels constraint)."""
+    if y_max <= 0: return 1.0
+    target = y_max / 10.0
+    exponent = np.floor(np.log10(target)) if target > 0 else 0
+    magnitude = 10 ** exponent
+    multipliers = [1, 2, 5]
+    candidates = []
+    for p in [magnitude/10, magnitude, magnitude*10]:
+        for m in multipliers:
+            candidates.append(m * p)
+    candidates = sorted(list(set(candidates)))
+    best_step = min(candidates, key=lambda x: abs(x - target))
+    try:
+        current_idx = candidates.index(best_step)
+    except ValueError:
+        current_idx = 0
+    while (y_max / candidates[current_idx]) > 10 and current_idx < len(candidates) - 1:
+        current_idx += 1
+    while (y_max / candidates[current_idx]) < 4 and current_idx > 0:
+        current_idx -= 1
+    return candidates[current_idx]
+
+def create_custom_colormap():
+    """Creates a colormap that transitions from Red -> Orange -> Dark Yellow -> Green."""
+    colors = [
+        (0.0, "#d73027"), # Red
+        (0.25, "#fc8d59"), # Orange
+        (0.5,  "#CCCC00"), # Darker Yellow/Mustard
+        (0.75, "#91cf60"), # Light Green
+        (1.0,  "#1a9850")  # Dark Green
+    ]
+    return mcolors.LinearSegmentedColormap.from_list("custom_exam_cmap", colors)
+
+def init_drawing():
+    """Per-process warm-up before the first chart: Agg backend and font lookup."""
+    plt.switch_backend('Agg')
+    findfont(FontProperties())
+
+# --- BAR VALUE LABELS ---
+
+BAR_LABEL_FONTSIZE = 9 * SCALE_H
+
+def bar_label_positions(rects, y, y_axis_max):
+    """
+    (x, y, text) anchor of every non-zero bar's label, in data coordinates.
+    Labels sit inside the bar (at its bottom) when taller than 5% of the axis, otherwise just above it.
+    """
+    label_threshold = y_axis_max * 0.05
+    labels = []
+    for rect, val in zip(rects, y):
+        if val == 0: continue
+        height = rect.get_height()
+        if height > label_threshold:
+            y_pos = y_axis_max * 0.005
+        else:
+            y_pos = height + (y_axis_max * 0.005)
+        labels.append((rect.get_x() + rect.get_width() / 2, y_pos, f"{int(val):,}"))
+    return labels
+
+def draw_text_bar_labels(ax, labels, fontsize):
+    """One rotated Text artist per label."""
+    return [
+        ax.text(x, y_pos, label_str, ha='center', va='bottom', rotation=90,
+                fontsize=fontsize, color='black', zorder=4)
+        for x, y_pos, label_str in labels
+    ]
+
+# --- CHART TEMPLATES ---
+# The figure, axes, bars, grid, x ticks and text styling only depend on the chart type
+# and step size. A template builds them once; each chart then only updates the bar
+# heights, labels, y axis, title and legend text before saving.
+
+def build_chart_template(x_scores, x_max, bar_width, x_label, xtick_fontsize, grid_alpha):
+    """Creates the static part of a distribution chart for a fixed score grid."""
+    fig, ax = plt.subplots(figsize=FIG_SIZE, dpi=DPI)
+    ax.set_xlim(-0.1, x_max + 0.1)
+
+    # Colors only depend on the score grid
+    cmap = create_custom_colormap()
+    norm = mcolors.Normalize(vmin=0, vmax=x_max)
+    colors = cmap(norm(x_scores))
+    rects = ax.bar(x_scores, np.zeros(len(x_scores)), width=bar_width, color=colors, align='center', zorder=3)
+
+    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda x, p: format(int(x), ',')))
+    ax.set_xticks(x_scores)
+    ax.set_xticklabels([f"{v:g}" for v in x_scores], rotation=90, fontsize=xtick_fontsize)
+    ax.grid(True, which='major', axis='both', linestyle='-', linewidth=0.5 * SCALE_W, alpha=grid_alpha, color='#555555', zorder=0)
+
+    label_fs = 20 * SCALE_H
+    ax.tick_params(axis='y', labelsize=14 * SCALE_H)
+    ax.set_xlabel(x_label, fontsize=label_fs, labelpad=25 * SCALE_H)
+    ax.set_ylabel("Số lượng thí sinh", fontsize=label_fs, labelpad=35 * SCALE_H)
+    total_text = ax.text(0, 1.01, "", transform=ax.transAxes, fontsize=label_fs, fontweight='bold', va='bottom', ha='left')
+
+    props = dict(boxstyle='square,pad=1', facecolor='white', alpha=0.75, edgecolor='black', linewidth=2 * SCALE_W)
+    legend_text = ax.text(0.02, 0.98, "", transform=ax.transAxes, fontsize=12 * SCALE_H,
+                          verticalalignment='top', horizontalalignment='left', bbox=props, zorder=5)
+
+    fig.subplots_adjust(top=0.90, bottom=0.12, left=0.08, right=0.96)
+    return {
+        'fig': fig,
+        'ax': ax,
+        'rects': rects,
+        'total_text': total_text,
+        'legend_text': legend_text,
+        'bar_labels': [],
+    }
+
+def khoi_chart_template():
+    return build_chart_template(KHOI_SCORE_GRID, KHOI_MAX_SCORE, 0.2, "Khoảng điểm", 9 * SCALE_H, 0.6)
+
+def subject_chart_template(step):
+    all_scores = subject_score_grid(step)
+    font_size_x = 8 * SCALE_H if step < 0.25 else 9 * SCALE_H
+    return build_chart_template(all_scores, 10, step * 0.8, "Điểm số", font_size_x, 0.3)
+
+def get_chart_template(templates, key, factory):
+    """Returns the cached template for key, building it on first use."""
+    if key not in templates:
+        templates[key] = factory()
+    return templates[key]
+
+def close_chart_template(template):
+    plt.close(template['fig'])
+
+def close_chart_templates(templates):
+    for template in templates.values():
+        close_chart_template(template)
+    templates.clear()
+
+def fill_chart_template(template, y, title_text, total_candidates, legend_text):
+    """Updates the data-driven artists of a template for one chart."""
+    ax = template['ax']
+    max_count = y.max()
+    y_axis_max = max_count * 4 / 3
+    ax.set_ylim(0, y_axis_max)
+
+    for rect, val in zip(template['rects'], y):
+        rect.set_height(val)
+
+    for label in template['bar_labels']:
+        label.remove()
+    labels = bar_label_positions(template['rects'], y, y_axis_max)
+    template['bar_labels'] = draw_text_bar_labels(ax, labels, BAR_LABEL_FONTSIZE)
+
+    y_step = get_y_tick_step(y_axis_max)
+    y_ticks = np.arange(0, y_axis_max + (y_step*0.1), y_step)
+    y_ticks = y_ticks[y_ticks <= y_axis_max * 1.05]
+    ax.set_yticks(y_ticks)
+
+    ax.set_title(title_text, fontsize=32 * SCALE_H, fontweight='bold', pad=35 * SCALE_H)
+    template['total_text'].set_text(f"Số lượng thí sinh: {total_candidates:,}")
+    template['legend_text'].set_text(legend_text)
+
+def save_chart_template(template, filename_base, formats):
+    """
+    Writes only the requested formats. Each format is one draw of the already
+    laid-out template (Agg for PNG, the vector backend for SVG).
+    """
+    fig = template['fig']
+    if 'png' in formats:
+        fig.savefig(f"{filename_base}.png", format='png', dpi=DPI)
+    if 'svg' in formats:
+        fig.savefig(f"{filename_base}.svg", format='svg')
@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import time
+
+import matplotlib_score_dist_main as charts
+from matplotlib_score_dist_preprocess_khoi import KHOI_COLUMNS, KHOI_PARSER_VERSION, parse_khoi_workbook, write_khoi_csv
+from matplotlib_score_dist_preprocess_mon import MON_PARSER_VERSION, parse_mon_workbook
+from score_dist_stats import (HIGHEST_SCORE_CSV, STATS_OUTPUT_PATH, load_highest_score_frame, prepare_khoi_frame,
+                              prepare_subject_frame)
+from workbook_cache import load_parsed_workbook
+
+# Workbooks -> preprocessed tables -> charts in one process. The preprocessed frames go
+# straight to the chart stage; the CSVs the stages used to exchange are an optional side output.
+
+KHOI_WORKBOOK = 'khoi_score_distribution_raw.xlsx'
+MON_WORKBOOK = 'mon_score_distribution_raw.xlsx'
+KHOI_CSV = 'matplotlib_score_dist_preprocess_khoi.csv'
+MON_CSV = 'transformed.csv'
+
+def preprocess(khoi_workbook=KHOI_WORKBOOK, mon_workbook=MON_WORKBOOK, highest_score_csv=HIGHEST_SCORE_CSV,
+               write_csv=False, use_cache=True):
+    """
+    Runs both preprocessors (through the parsed-workbook cache) and returns the chart inputs
+    {'khoi', 'highest_score', 'subject'}, in the shape load_chart_inputs() reads from the CSVs.
+    write_csv also writes the preprocessed tables to KHOI_CSV and MON_CSV.
+    """
+    inputs = {'khoi': None, 'highest_score': None, 'subject': None}
+
+    if os.path.exists(khoi_workbook):
+        khoi_table = load_parsed_workbook(khoi_workbook, parse_khoi_workbook, KHOI_PARSER_VERSION, use_cache)
+        if write_csv:
+            write_khoi_csv(khoi_table, KHOI_CSV)
+            print(f"CSV file '{KHOI_CSV}' has been created.")
+        inputs['khoi'] = prepare_khoi_frame(khoi_table[KHOI_COLUMNS])
+        inputs['highest_score'] = load_highest_score_frame(highest_score_csv)
+    else:
+        print(f"Skipping Khoi (Group) processing: {khoi_workbook} not found.")
+
+    if os.path.exists(mon_workbook):
+        mon_table = load_parsed_workbook(mon_workbook, parse_mon_workbook, MON_PARSER_VERSION, use_cache)
+        if write_csv:
+            mon_table.to_csv(MON_CSV, index=False)
+            print(f"CSV file '{MON_CSV}' has been created.")
+        inputs['subject'] = prepare_subject_frame(mon_table)
+    else:
+        print(f"Skipping Subject (Mon) processing: {mon_workbook} not found.")
+
+    return inputs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess the score workbooks and render the distribution charts in one run.")
+    parser.add_argument('--khoi-workbook', default=KHOI_WORKBOOK, help="Khoi workbook (default: %(default)s)")
+    parser.add_argument('--mon-workbook', default=MON_WORKBOOK, help="Subject workbook (default: %(default)s)")
+    parser.add_argument('--write-csv', action='store_true', help=f"Also write {KHOI_CSV} and {MON_CSV}.")
+    parser.add_argument('--no-cache', action='store_true', help="Always re-parse the workbooks, ignoring the parsed-workbook cache.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Rebuild every chart even if its inputs are unchanged.")
+    parser.add_argument('--no-templates', action='store_true', help="Build a fresh figure for every chart.")
+    parser.add_argument('--formats', nargs='+', choices=charts.CHART_FORMATS, default=list(charts.CHART_FORMATS),
+                        help="Output formats to write for every chart (default: svg png).")
+    parser.add_argument('--stats-only', action='store_true',
+                        help="Only write the chart statistics table (no rendering).")
+    parser.add_argument('--stats-output', default=STATS_OUTPUT_PATH,
+                        help="Statistics table for --stats-only, .csv or .parquet (default: %(default)s)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    inputs = preprocess(args.khoi_workbook, args.mon_workbook, write_csv=args.write_csv, use_cache=not args.no_cache)
+    print(f"Preprocessing done in {time.perf_counter() - start:.2f}s")
+
+    results = charts.main(force=args.force, use_templates=not args.no_templates,
+                          formats=tuple(args.formats), workers=args.workers, stats_only=args.stats_only,
+                          stats_output=args.stats_output, inputs=inputs)
+    if any(not r['ok'] for r in results):
+        sys.exit(1)
@@ -0,0 +1,395 @@
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from score_schema import apply_score_schema, exact_scores
+
+# Statistics behind the score-distribution charts (mean, z-level scores, threshold counts,
+# highest score), computed for every chart group at once on dense (group x bin) count
+# matrices. This module does not import matplotlib, so tables for reports can be built
+# without paying for the plotting stack.
+
+KHOI_INPUT_CSV = 'matplotlib_score_dist_preprocess_khoi_test.csv'
+SUBJECT_INPUT_CSV = 'matplotlib_score_dist_preprocess_mon_test.csv'
+HIGHEST_SCORE_CSV = 'highest_score.csv'
+STATS_OUTPUT_PATH = 'score_dist_stats.csv'
+
+# Subject codes (chart file names, STEP_CONFIG keys) -> display names used in chart titles
+SUBJECT_NAME_MAP = {
+    "NguVan": "Ngữ văn",
+    "Toan": "Toán",
+    "NgoaiNgu": "Ngoại ngữ",
+    "VatLy": "Vật lí",
+    "HoaHoc": "Hóa học",
+    "SinhHoc": "Sinh học",
+    "LichSu": "Lịch sử",
+    "DiaLy": "Địa lí",
+    "GDCD": "Giáo dục công dân",
+    "KinhTePhapLuat": "Kinh tế Pháp luật",
+    "TinHoc": "Tin học",
+    "CongNgheCongNghiep": "Công nghệ - Công nghiệp",
+    "CongNgheNongNghiep": "Công nghệ - Nông nghiệp"
+}
+
+# Display names used in the mon workbook -> subject codes. The 2013 sheet lists khoi A1's
+# foreign-language paper as 'Tiếng Anh'; 2014 lists the same paper as 'Ngoại ngữ'.
+SUBJECT_CODE_MAP = {name: code for code, name in SUBJECT_NAME_MAP.items()}
+SUBJECT_CODE_MAP['Tiếng Anh'] = 'NgoaiNgu'
+
+# Structure: {Year: {Subject: Step}}
+STEP_CONFIG = {
+    2025: {"default": 0.25, "GDCD": None},
+    2024: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2023: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2022: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2021: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2020: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2019: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2018: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2017: {"Toan": 0.2, "NgoaiNgu": 0.2, "default": 0.25},
+    2016: {"Toan": 0.25, "NgoaiNgu": 0.2, "VatLy": 0.2, "HoaHoc": 0.2, "SinhHoc": 0.2, "default": 0.25},
+}
+# Years 2007-2015 are all 0.25
+for y in range(2007, 2016):
+    STEP_CONFIG[y] = {"default": 0.25}
+
+# Legend percentiles: (z, "Top %" label, normal CDF at z)
+Z_SCORE_DEFS = [
+    (3,  "99.87", 0.9987),
+    (2,  "97.72", 0.9772),
+    (1,  "84.13", 0.8413),
+    (0,  "50",    0.5000),
+    (-1, "15.87", 0.1587),
+    (-2, "2.28",  0.0228),
+    (-3, "0.13",  0.0013)
+]
+Z_SCORE_PROBS = np.array([prob for _, _, prob in Z_SCORE_DEFS])
+
+# Khoi charts: 0-30 in quarter points; subject charts: 0-10 in the year/subject step
+KHOI_SCORE_GRID = np.arange(0, 30.25, 0.25)
+KHOI_MAX_SCORE = 30
+KHOI_THRESHOLDS = (15, 18, 21, 24, 27)
+SUBJECT_MAX_SCORE = 10
+SUBJECT_THRESHOLDS = (5, 6, 7, 8, 9)
+
+STATS_COLUMNS = ['kind', 'year', 'subject', 'khoi', 'step', 'statistic', 'value']
+
+def get_step_size(year, subject):
+    """Determines step size (0.2 or 0.25) based on year and subject."""
+    year_int = int(year)
+    if year_int not in STEP_CONFIG:
+        return 0.25
+    config = STEP_CONFIG[year_int]
+    if subject in config:
+        val = config[subject]
+        if val is None: return None
+        return val
+    if "default" in config:
+        return config["default"]
+    return 0.25
+
+def z_stat_name(z):
+    sign = "+" if z > 0 else ""
+    return f"score_at_z{sign}{z}"
+
+# --- BINNING ---
+
+def subject_score_grid(step):
+    """Bin start scores 0, step, ..., 10 of a subject chart, rounded to 3 decimals."""
+    num_steps = int(10.0 / step) + 1
+    return np.round(np.linspace(0, 10, num_steps), 3)
+
+def calculate_bin(score, step):
+    """Bin start for one score: floor to the step grid, 10.0 stays 10.0, missing scores go to 0."""
+    if pd.isna(score): return 0
+    if math.isclose(score, 10.0, rel_tol=1e-9):
+        return 10.0
+    val = score / step
+    floored = math.floor(round(val, 6))
+    return round(floored * step, 3)
+
+def subject_score_bins(scores, steps):
+    """
+    Grid index of every raw subject score (-1 when outside 0-10); steps is one step or one per score.
+
+    Scores are binned as integer hundredths: bin index = hundredths // step-in-hundredths.
+    This is the same bin calculate_bin picks (10.0 lands in the last bin, missing scores in
+    the first); scores that are not whole hundredths fall back to calculate_bin itself.
+    """
+    # Compact float32 scores are widened and rounded first, so 6.2 bins as 6.2 and not 6.1999998
+    scores = exact_scores(pd.Series(scores)).to_numpy()
+    steps = np.broadcast_to(np.asarray(steps, dtype=float), scores.shape)
+
+    step_hundredths = np.rint(steps * 100).astype(np.int64)
+    hundredths = np.rint(scores * 100)
+    missing = np.isnan(scores)
+    scaled = ~missing & (np.abs(scores * 100 - hundredths) < 1e-6)
+
+    bins = np.zeros(len(scores), dtype=np.int64)
+    bins[scaled] = hundredths[scaled].astype(np.int64) // step_hundredths[scaled]
+    for i in np.flatnonzero(~missing & ~scaled):
+        grid = subject_score_grid(steps[i])
+        matches = np.flatnonzero(grid == calculate_bin(scores[i], steps[i]))
+        bins[i] = matches[0] if len(matches) else -1
+
+    n_bins = np.rint(10.0 / steps).astype(np.int64) + 1
+    bins[(bins < 0) | (bins >= n_bins)] = -1
+    return bins
+
+def khoi_score_bins(min_scores):
+    """Grid index of every khoi min_score; scores off the quarter-point grid get -1, as the grid merge dropped them."""
+    quarters = np.asarray(min_scores, dtype=float) * 4
+    on_grid = np.isfinite(quarters) & (quarters == np.round(quarters))
+    bins = np.where(on_grid, quarters, -1).astype(np.int64)
+    bins[(bins < 0) | (bins >= len(KHOI_SCORE_GRID))] = -1
+    return bins
+
+def dense_counts(group_codes, bins, counts, n_groups, n_bins):
+    """(n_groups x n_bins) candidate counts from per-row group codes and bin indexes (-1 rows are dropped)."""
+    counts = np.nan_to_num(np.asarray(counts, dtype=float))
+    keep = (bins >= 0) & (group_codes >= 0)
+    flat = np.bincount(group_codes[keep] * n_bins + bins[keep], weights=counts[keep], minlength=n_groups * n_bins)
+    return flat.reshape(n_groups, n_bins)
+
+def process_data_binning(df, step):
+    """
+    Bins raw subject scores according to the step size.
+    Returns (score grid, candidate count per bin) as dense arrays aligned to subject_score_grid(step).
+    """
+    all_scores = subject_score_grid(step)
+    scores = pd.to_numeric(df['Score'], errors='coerce')
+    counts = pd.to_numeric(df['count'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    bins = subject_score_bins(scores, step)
+    binned = dense_counts(np.zeros(len(bins), dtype=np.int64), bins, counts, 1, len(all_scores))[0]
+    return all_scores, binned
+
+# --- STATISTICS ---
+
+def find_scores_at_percentiles(scores_desc, cumulative, targets):
+    """
+    For every group (row) and target cumulative count, the score whose cumulative count is nearest.
+    scores_desc: (bins,) descending; cumulative: (groups x bins), non-decreasing per row; targets: (groups x k).
+    Ties go to the first position in descending-score order, like abs().idxmin().
+    Positions come from a broadcast comparison, i.e. a row-wise searchsorted(side='left').
+    """
+    targets = np.asarray(targets, dtype=float)
+    n = cumulative.shape[1]
+    rows = np.arange(cumulative.shape[0])[:, None]
+    right = (cumulative[:, None, :] < targets[:, :, None]).sum(axis=2)
+    left = right - 1
+    right_dist = np.abs(cumulative[rows, np.minimum(right, n - 1)] - targets)
+    left_dist = np.abs(cumulative[rows, np.maximum(left, 0)] - targets)
+    take_left = (right >= n) | ((left >= 0) & (left_dist <= right_dist))
+    idx = np.where(take_left, left, right)
+    # Zero-count scores repeat a cumulative value; idxmin returns the first of those
+    nearest = cumulative[rows, idx]
+    idx = (cumulative[:, None, :] < nearest[:, :, None]).sum(axis=2)
+    return scores_desc[idx]
+
+def distribution_stats(score_grid, count_matrix, thresholds, max_score):
+    """
+    Chart statistics for every row of a (groups x bins) count matrix over score_grid:
+    total, mean, highest non-empty bin and its count, the Z_SCORE_DEFS scores, and for every
+    threshold the number of candidates at or above it (exactly max_score for the last one)
+    with the chart's "Top %" figure (100 - share of candidates).
+    Returns a dict of per-group arrays.
+    """
+    count_matrix = np.asarray(count_matrix, dtype=float)
+    total = count_matrix.sum(axis=1)
+    has_total = total > 0
+    safe_total = np.where(has_total, total, 1)
+
+    mean = np.where(has_total, (count_matrix * score_grid).sum(axis=1) / safe_total, 0)
+
+    non_empty = count_matrix > 0
+    last_bin = count_matrix.shape[1] - 1 - np.argmax(non_empty[:, ::-1], axis=1)
+    rows = np.arange(count_matrix.shape[0])
+    stats = {
+        'total_candidates': total,
+        'mean_score': mean,
+        'max_score': np.where(non_empty.any(axis=1), score_grid[last_bin], np.nan),
+        'max_score_count': np.where(non_empty.any(axis=1), count_matrix[rows, last_bin], 0),
+    }
+
+    # Z-level scores on the descending cumulative distribution
+    order = np.argsort(-score_grid, kind='stable')
+    cumulative = np.cumsum(count_matrix[:, order], axis=1)
+    targets = total[:, None] * (1.0 - Z_SCORE_PROBS)
+    z_scores = find_scores_at_percentiles(score_grid[order], cumulative, targets)
+    for i, (z, _, _) in enumerate(Z_SCORE_DEFS):
+        stats[z_stat_name(z)] = z_scores[:, i]
+
+    for threshold in thresholds:
+        cnt = count_matrix[:, score_grid >= (threshold - 0.001)].sum(axis=1)
+        stats[f'count_ge_{threshold}'] = cnt
+        stats[f'top_pct_ge_{threshold}'] = np.where(has_total, 100 - cnt / safe_total * 100, 0)
+    cnt = count_matrix[:, np.isclose(score_grid, max_score)].sum(axis=1)
+    stats[f'count_eq_{max_score}'] = cnt
+    stats[f'top_pct_eq_{max_score}'] = np.where(has_total, 100 - cnt / safe_total * 100, 0)
+    return stats
+
+def single_group_stats(score_grid, counts, thresholds, max_score):
+    """distribution_stats for one count vector, as a dict of scalars."""
+    stats = distribution_stats(score_grid, np.asarray(counts, dtype=float)[None, :], thresholds, max_score)
+    return {name: values[0] for name, values in stats.items()}
+
+# --- DATA LOADING ---
+
+def load_highest_score_frame(highest_score_csv=HIGHEST_SCORE_CSV):
+    """Highest score per (year, khoi); an empty frame if the CSV is missing."""
+    if os.path.exists(highest_score_csv):
+        return apply_score_schema(pd.read_csv(highest_score_csv))
+    print(f"Warning: {highest_score_csv} not found. Charts will miss highest score info.")
+    return pd.DataFrame(columns=['year', 'khoi', 'highest_score', 'so_luong'])
+
+def prepare_khoi_frame(df):
+    """
+    Khoi distribution frame keyed by each range's lower bound, with the compact schema.
+    Accepts the khoi preprocessor's output as is: it keeps a range's bounds in sheet order
+    ('29.75 - 29.95' gives max_score=29.75, min_score=29.95), while the charts bin on
+    min_score. min_score becomes the lower bound on the 0.25 grid, max_score the upper bound.
+    """
+    first = pd.to_numeric(df['max_score'], errors='coerce')
+    second = pd.to_numeric(df['min_score'], errors='coerce')
+    lower = np.fmin(first, second)
+    df = df.assign(max_score=np.fmax(first, second), min_score=np.floor(lower * 4 + 1e-6) / 4)
+    return apply_score_schema(df)
+
+def load_khoi_frames(input_csv=KHOI_INPUT_CSV, highest_score_csv=HIGHEST_SCORE_CSV):
+    """Khoi distribution and highest-score frames, or (None, None) if the distribution CSV is missing."""
+    if not os.path.exists(input_csv):
+        print(f"Skipping Khoi (Group) processing: {input_csv} not found.")
+        return None, None
+    return prepare_khoi_frame(pd.read_csv(input_csv)), load_highest_score_frame(highest_score_csv)
+
+def prepare_subject_frame(df):
+    """
+    Subject distribution frame with integer years, subject codes and the compact schema.
+    Accepts the mon preprocessor's output as is: its khoi_thi column becomes khoi and its
+    subject display names ('Toán', 'Vật lí', ...) become codes ('Toan', 'VatLy', ...).
+    """
+    df = df.rename(columns={'khoi_thi': 'khoi'})
+    df['Subject'] = df['Subject'].replace(SUBJECT_CODE_MAP)
+    df['Year'] = pd.to_numeric(df['Year'], errors='coerce')
+    df = df.dropna(subset=['Year'])
+    df['Year'] = df['Year'].astype(int)
+    return apply_score_schema(df)
+
+def load_subject_frame(input_csv=SUBJECT_INPUT_CSV):
+    """Subject distribution frame from CSV, or None if the CSV is missing."""
+    if not os.path.exists(input_csv):
+        print(f"Skipping Subject (Mon) processing: {input_csv} not found.")
+        return None
+    return prepare_subject_frame(pd.read_csv(input_csv))
+
+def load_chart_inputs(khoi_csv=KHOI_INPUT_CSV, subject_csv=SUBJECT_INPUT_CSV, highest_score_csv=HIGHEST_SCORE_CSV):
+    """
+    Chart input frames read from the preprocessed CSVs: {'khoi', 'highest_score', 'subject'}.
+    A missing input is None; the pipeline builds the same dict in memory.
+    """
+    df_khoi, df_high = load_khoi_frames(khoi_csv, highest_score_csv)
+    return {'khoi': df_khoi, 'highest_score': df_high, 'subject': load_subject_frame(subject_csv)}
+
+# --- STATS TABLES ---
+
+def tidy_stats(groups, stats, kind, step=None):
+    """Long table: one row per (group, statistic); groups holds year/subject/khoi columns in stats order."""
+    if len(groups) == 0:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    wide = groups.reset_index(drop=True).assign(kind=kind, step=step, **stats)
+    return wide.melt(id_vars=['kind', 'year', 'subject', 'khoi', 'step'], var_name='statistic', value_name='value')
+
+def khoi_stats_table(df, df_high):
+    """Statistics of every (year, khoi) chart group in one pass; groups without candidates are left out."""
+    keys = df[['year', 'khoi']].astype({'khoi': object})
+    # Rows without a year or khoi belong to no chart (groupby drops them too)
+    usable = keys.notna().all(axis=1).to_numpy()
+    keys = keys[usable]
+    codes = keys.groupby(['year', 'khoi'], sort=True).ngroup().to_numpy()
+    groups = keys.drop_duplicates().sort_values(['year', 'khoi'])
+    counts = pd.to_numeric(df['count'], errors='coerce').fillna(0)[usable]
+    bins = khoi_score_bins(df['min_score'][usable])
+    matrix = dense_counts(codes, bins, counts, len(groups), len(KHOI_SCORE_GRID))
+
+    stats = distribution_stats(KHOI_SCORE_GRID, matrix, KHOI_THRESHOLDS, KHOI_MAX_SCORE)
+
+    # Highest score comes from highest_score.csv (first row per group), not from the distribution
+    high = df_high[['year', 'khoi', 'highest_score', 'so_luong']].astype({'khoi': object})
+    high = high.drop_duplicates(['year', 'khoi'])
+    high = groups.merge(high, on=['year', 'khoi'], how='left')
+    stats['highest_score'] = pd.to_numeric(high['highest_score'], errors='coerce').to_numpy(dtype=float)
+    stats['highest_score_count'] = pd.to_numeric(high['so_luong'], errors='coerce').to_numpy(dtype=float)
+
+    keep = matrix.max(axis=1) > 0
+    groups = groups.assign(subject=None)[keep]
+    return tidy_stats(groups, {name: values[keep] for name, values in stats.items()}, 'khoi')
+
+def subject_stats_table(df):
+    """
+    Statistics of every subject chart group: (year, subject, khoi) up to 2014, (year, subject) after.
+    Each step size is one pass; groups without candidates or without a step (e.g. GDCD 2025) are left out.
+    """
+    years = df['Year'].to_numpy()
+    subjects = df['Subject'].astype(object)
+    khoi_labels = np.where(years <= 2014, df['khoi'].astype(object), "")
+    frame = pd.DataFrame({'year': years, 'subject': subjects, 'khoi': khoi_labels})
+
+    pairs = frame[['year', 'subject']].drop_duplicates()
+    pairs['step'] = [get_step_size(y, s) for y, s in pairs.itertuples(index=False)]
+    frame = frame.merge(pairs, on=['year', 'subject'], how='left')
+    # Pre-2015 rows without a khoi belong to no chart
+    usable = frame['step'].notna() & frame['khoi'].notna()
+
+    tables = []
+    for step in sorted(frame.loc[usable, 'step'].unique()):
+        rows = usable & (frame['step'] == step)
+        keys = frame.loc[rows, ['year', 'subject', 'khoi']]
+        codes = keys.groupby(['year', 'subject', 'khoi'], sort=True).ngroup().to_numpy()
+        groups = keys.drop_duplicates().sort_values(['year', 'subject', 'khoi'])
+        grid = subject_score_grid(step)
+        bins = subject_score_bins(pd.to_numeric(df['Score'], errors='coerce')[rows.to_numpy()], step)
+        counts = pd.to_numeric(df['count'], errors='coerce').fillna(0)[rows.to_numpy()]
+        matrix = dense_counts(codes, bins, counts, len(groups), len(grid))
+
+        stats = distribution_stats(grid, matrix, SUBJECT_THRESHOLDS, SUBJECT_MAX_SCORE)
+        keep = matrix.max(axis=1) > 0
+        tables.append(tidy_stats(groups[keep], {name: values[keep] for name, values in stats.items()},
+                                 'subject', step))
+
+    if not tables:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    return pd.concat(tables, ignore_index=True)
+
+def compute_stats_table(inputs=None):
+    """Tidy statistics table of every khoi and subject chart group; inputs defaults to load_chart_inputs()."""
+    if inputs is None:
+        inputs = load_chart_inputs()
+    tables = []
+    if inputs['khoi'] is not None:
+        tables.append(khoi_stats_table(inputs['khoi'], inputs['highest_score']))
+    if inputs['subject'] is not None:
+        tables.append(subject_stats_table(inputs['subject']))
+    if not tables:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    return pd.concat(tables, ignore_index=True)[STATS_COLUMNS]
+
+def write_stats_table(stats, output_path=STATS_OUTPUT_PATH):
+    """Writes the stats table as Parquet when output_path ends in .parquet, CSV otherwise."""
+    if output_path.endswith('.parquet'):
+        stats.to_parquet(output_path, index=False)
+    else:
+        stats.to_csv(output_path, index=False, encoding='utf-8-sig')
+    print(f"Wrote {len(stats)} statistics to {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute score-distribution chart statistics without rendering.")
+    parser.add_argument('--output', default=STATS_OUTPUT_PATH, help="Output .csv or .parquet (default: %(default)s)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_stats_table(compute_stats_table(), args.output)
+    print(f"Statistics computed in {time.perf_counter() - start:.2f}s")
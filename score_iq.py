@@ -0,0 +1,29 @@
+import numpy as np
+from scipy.stats import norm
+
+# IQ15 column of the preprocessed distributions, shared by the mon and khoi preprocessors:
+# the share of candidates strictly below a score, mapped through the normal quantile
+# function onto an IQ scale (mean 100, sd 15).
+
+IQ_MEAN = 100
+IQ_SD = 15
+IQ_EPSILON = 1e-9
+
+def below_proportions(cumulative, total):
+    """Share of candidates strictly below each score, from at-or-above cumulative counts."""
+    cumulative = np.asarray(cumulative, dtype=float)
+    if total > 0:
+        return (total - cumulative) / total
+    return np.zeros(len(cumulative))
+
+def iq15_values(proportions):
+    """
+    IQ15 text for every proportion, with one norm.ppf call for the whole array:
+    7 decimals without trailing zeros, '-' where the proportion is within epsilon of 0 or 1.
+    """
+    proportions = np.asarray(proportions, dtype=float)
+    inside = (proportions > IQ_EPSILON) & (proportions < (1.0 - IQ_EPSILON))
+    iq_values = IQ_MEAN + IQ_SD * norm.ppf(proportions[inside])
+    text = np.full(len(proportions), '-', dtype=object)
+    text[inside] = np.char.rstrip(np.char.rstrip(np.char.mod('%.7f', iq_values), '0'), '.')
+    return text.tolist()
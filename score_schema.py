@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+# Compact in-memory schema shared by the map script and the score-distribution scripts.
+# Bump SCORE_SCHEMA_VERSION whenever a dtype below changes, so typed caches get rebuilt.
+
+SCORE_SCHEMA_VERSION = 1
+
+YEAR_COLS = ['Year', 'year']
+CATEGORY_COLS = ['Subject', 'Province_Code', 'khoi', 'khoi_thi']
+SCORE_COLS = ['Score', 'score', 'min_score', 'max_score', 'Average_Score', 'highest_score']
+COUNT_COLS = ['Count', 'count', 'Cumulative', 'cumulative', 'so_luong']
+
+def normalize_province_codes(series):
+    """Zero-pads province codes without a per-row apply: '1', '1.0' and 1 all become '01'."""
+    as_text = series.astype(object).where(series.notna(), 'nan').astype(str)
+    return as_text.str.split('.', n=1).str[0].str.zfill(2)
+
+def compact_count_column(series):
+    """int32 when every value is a whole number, float32 otherwise (keeps NaN)."""
+    values = pd.to_numeric(series, errors='coerce')
+    if values.notna().all() and (values % 1 == 0).all():
+        return values.astype('int32')
+    return values.astype('float32')
+
+def apply_score_schema(df):
+    """
+    Converts the known columns of a score frame to compact dtypes:
+    int16 years, categorical subject/khoi/province, float32 scores, int32 counts.
+    Unknown columns are left untouched.
+    """
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if col in YEAR_COLS:
+            df[col] = df[col].astype('int16')
+        elif col in CATEGORY_COLS:
+            df[col] = df[col].astype('category')
+        elif col in SCORE_COLS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+        elif col in COUNT_COLS:
+            df[col] = compact_count_column(df[col])
+    return df
+
+def exact_scores(series, decimals=6):
+    """float64 copy of a (possibly float32) score column, rounded so 6.2 stays 6.2 and not 6.1999998."""
+    return np.round(series.astype('float64'), decimals)
@@ -0,0 +1,148 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matplotlib_average_score_map import get_stats_for_table
+from score_schema import apply_score_schema
+
+YEAR = 2020
+SUBJECT = 'Toan'
+MAX_SCORE = 10
+
+def legacy_get_stats_for_table(year, subject, max_score, df_dist, df_avg, df_prov):
+    """The per-province loop get_stats_for_table replaced, kept as the parity reference."""
+    percentages = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+    thresholds = [p * max_score for p in percentages]
+
+    sub_dist = df_dist[(df_dist['Year'] == year) & (df_dist['Subject'] == subject)].copy()
+    sub_avg = df_avg[(df_avg['Year'] == year) & (df_avg['Subject'] == subject)].copy()
+
+    table_rows = []
+    valid_provinces = df_prov['Province_Code'].unique()
+
+    national_sums = {t: 0 for t in thresholds}
+    national_total_count = 0
+
+    for prov_code in valid_provinces:
+        prov_name_series = df_prov[df_prov['Province_Code'] == prov_code]['ten_tinh']
+        if prov_name_series.empty: continue
+        prov_name = prov_name_series.values[0]
+
+        avg_row = sub_avg[sub_avg['Province_Code'] == prov_code]
+        avg_score = avg_row['Average_Score'].values[0] if not avg_row.empty else 0.0
+
+        prov_dist = sub_dist[sub_dist['Province_Code'] == prov_code]
+
+        if prov_dist.empty and avg_row.empty:
+            continue
+
+        if 'Cumulative' in prov_dist.columns:
+            total_count = prov_dist['Cumulative'].max()
+        else:
+            total_count = prov_dist['Count'].sum()
+
+        if pd.isna(total_count) or total_count == 0:
+            total_count = prov_dist['Count'].sum()
+
+        national_total_count += total_count
+
+        row_data = {
+            'Name': prov_name,
+            'Count': int(total_count),
+            'Avg': float(avg_score) if not pd.isna(avg_score) else 0.0
+        }
+
+        for t in thresholds:
+            count_ge = prov_dist[prov_dist['Score'] >= t]['Count'].sum()
+            row_data[f'ge_{t}'] = int(count_ge)
+            national_sums[t] += int(count_ge)
+
+        table_rows.append(row_data)
+
+    table_rows.sort(key=lambda x: x['Avg'], reverse=True)
+
+    for i, row in enumerate(table_rows):
+        row['STT'] = i + 1
+
+    nat_avg_row = sub_avg[sub_avg['Province_Code'].isin(['99', 'CaNuoc', '00'])]
+    national_avg = 0.0
+    if not nat_avg_row.empty:
+        national_avg = nat_avg_row['Average_Score'].values[0]
+
+    national_row = {
+        'STT': '',
+        'Name': 'Cả nước',
+        'Count': int(national_total_count),
+        'Avg': float(national_avg)
+    }
+    for t in thresholds:
+        national_row[f'ge_{t}'] = national_sums[t]
+
+    return table_rows, national_row, thresholds
+
+def synthetic_frames(with_cumulative=True):
+    """
+    Province 01: plain distribution; 02: NaN counts and scores; 03: distribution only, zero
+    Cumulative; 04: average only (NaN); 05: distribution for a province missing from df_prov;
+    06: listed province without data. Rows for another year/subject must be filtered out.
+    """
+    df_prov = pd.DataFrame({
+        'Province_Code': ['01', '02', '03', '04', '06', '01'],
+        'ten_tinh': ['Hà Nội', 'Hà Giang', 'Cao Bằng', 'Bắc Kạn', 'Tuyên Quang', 'Hà Nội (trùng)'],
+    })
+    df_avg = pd.DataFrame({
+        'Year': [YEAR, YEAR, YEAR, YEAR, YEAR, YEAR - 1],
+        'Subject': [SUBJECT, SUBJECT, SUBJECT, SUBJECT, SUBJECT, SUBJECT],
+        'Province_Code': ['01', '02', '04', '99', '01', '03'],
+        'Average_Score': [6.123456789, 7.0312345, np.nan, 6.543219876, 1.0, 9.9],
+    })
+    dist = [
+        ('01', 10.0, 3, 3), ('01', 9.25, 7, 10), ('01', 7.5, 20, 30), ('01', 5.0, 15, 45), ('01', 2.75, 5, 50),
+        ('02', 9.0, np.nan, 4), ('02', np.nan, 6, 10), ('02', 6.0, 12, np.nan), ('02', 4.5, 8, 30),
+        ('03', 8.0, 11, 0), ('03', 6.25, 9, 0), ('03', 5.5, np.nan, 0),
+        ('05', 9.5, 40, 40),
+    ]
+    df_dist = pd.DataFrame(dist, columns=['Province_Code', 'Score', 'Count', 'Cumulative'])
+    df_dist.insert(0, 'Subject', SUBJECT)
+    df_dist.insert(0, 'Year', YEAR)
+    other = df_dist.assign(Subject='NguVan', Count=df_dist['Count'] * 3)
+    df_dist = pd.concat([df_dist, other], ignore_index=True)
+    if not with_cumulative:
+        df_dist = df_dist.drop(columns='Cumulative')
+    return df_dist, df_avg, df_prov
+
+@pytest.mark.parametrize('with_cumulative', [True, False])
+@pytest.mark.parametrize('compact', [False, True])
+def test_matches_legacy_loop(with_cumulative, compact):
+    df_dist, df_avg, df_prov = synthetic_frames(with_cumulative)
+    if compact:
+        # Same frames through the compact schema: categorical codes/subjects, float32 scores
+        df_dist, df_avg = apply_score_schema(df_dist), apply_score_schema(df_avg)
+
+    expected = legacy_get_stats_for_table(YEAR, SUBJECT, MAX_SCORE, df_dist, df_avg, df_prov)
+    actual = get_stats_for_table(YEAR, SUBJECT, MAX_SCORE, df_dist, df_avg, df_prov)
+    assert actual == expected
+
+def test_compact_schema_only_changes_avg_precision():
+    """
+    Against the legacy loop on the original float64 frames, the compact (float32) schema
+    leaves counts and rows unchanged; averages become the float32-rounded values.
+    """
+    df_dist, df_avg, df_prov = synthetic_frames()
+    expected_rows, expected_national, expected_thresholds = legacy_get_stats_for_table(
+        YEAR, SUBJECT, MAX_SCORE, df_dist, df_avg, df_prov)
+    rows, national, thresholds = get_stats_for_table(
+        YEAR, SUBJECT, MAX_SCORE, apply_score_schema(df_dist), apply_score_schema(df_avg), df_prov)
+
+    assert thresholds == expected_thresholds
+    assert len(rows) == len(expected_rows)
+    for row, expected in zip(rows + [national], expected_rows + [expected_national]):
+        assert {k: v for k, v in row.items() if k != 'Avg'} == {k: v for k, v in expected.items() if k != 'Avg'}
+        assert row['Avg'] == float(np.float32(expected['Avg']))
+        assert row['Avg'] == pytest.approx(expected['Avg'], rel=1e-7)
+    assert national['Avg'] != expected_national['Avg']
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import openpyxl
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from matplotlib_score_dist_preprocess_khoi import KHOI_LIST, header_years
+from score_dist_pipeline import KHOI_WORKBOOK, preprocess
+from score_dist_stats import compute_stats_table
+
+KHOI_WORKBOOK_PATH = os.path.join(ROOT, KHOI_WORKBOOK)
+
+def workbook_khoi_totals(path):
+    """{(year, khoi): candidates} from the 'Tổng số thí sinh' row closing every khoi section."""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        totals = {}
+        khoi, years = None, []
+        for values in wb.active.iter_rows(values_only=True):
+            first = values[0] if values else None
+            if first in KHOI_LIST:
+                khoi, years = first, header_years(values)
+            elif khoi is not None and isinstance(first, str) and first.startswith('Tổng số thí sinh'):
+                for year, total in zip(years, values[1:]):
+                    totals[(int(year), khoi)] = int(total or 0)
+                khoi = None
+        return totals
+    finally:
+        wb.close()
+
+@pytest.mark.skipif(not os.path.exists(KHOI_WORKBOOK_PATH), reason="khoi workbook not available")
+def test_khoi_totals_match_workbook(tmp_path):
+    inputs = preprocess(KHOI_WORKBOOK_PATH, str(tmp_path / 'missing_mon.xlsx'),
+                        str(tmp_path / 'missing_highest_score.csv'), use_cache=False)
+    stats = compute_stats_table(inputs)
+    totals = stats[(stats['kind'] == 'khoi') & (stats['statistic'] == 'total_candidates')]
+    actual = {(int(row.year), row.khoi): int(row.value) for row in totals.itertuples(index=False)}
+
+    expected = {key: total for key, total in workbook_khoi_totals(KHOI_WORKBOOK_PATH).items() if total > 0}
+    assert len(expected) == 65
+    assert actual == expected
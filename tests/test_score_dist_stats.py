@@ -0,0 +1,24 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from score_dist_stats import load_highest_score_frame, khoi_stats_table, prepare_khoi_frame
+
+def test_khoi_rows_without_label_are_skipped(tmp_path):
+    df = prepare_khoi_frame(pd.DataFrame({
+        'max_score': [30.0, 29.75, 29.5],
+        'min_score': [30.0, 29.95, 29.7],
+        'year': [2025, 2025, 2025],
+        'khoi': ['A', 'A', np.nan],
+        'count': [8, 24, 58],
+        'cumulative': [8, 32, 90],
+    }))
+    stats = khoi_stats_table(df, load_highest_score_frame(str(tmp_path / 'missing.csv')))
+
+    assert set(zip(stats['year'], stats['khoi'])) == {(2025, 'A')}
+    totals = stats[stats['statistic'] == 'total_candidates']
+    assert totals['value'].tolist() == [32]
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+from build_manifest import file_sha256
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Feather caches of frames built from a source file, shared by the preprocessors (parsed
+# workbooks) and the map script (cleaned score CSVs). A cache file is named after the
+# source's SHA-256 and a version tag: an edited source or a bumped parser/schema version
+# misses the cache and the frame is built again. Without pyarrow every run rebuilds.
+
+CACHE_DIRNAME = 'cache'
+
+def cached_frame(source_path, cache_dir, version_tag, build):
+    """Returns build() (a DataFrame), reading it from cache_dir while source_path and version_tag are unchanged."""
+    if feather is None:
+        return build()
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    cache_path = os.path.join(cache_dir, f"{stem}.{file_sha256(source_path)[:16]}.{version_tag}.feather")
+
+    if os.path.exists(cache_path):
+        return feather.read_feather(cache_path)
+
+    df = build()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Drop caches built from older versions of the same source. Processes filling a cold cache
+    # at the same time (e.g. map workers) write the same file, so never remove that one.
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(f"{stem}.") and name.endswith('.feather') and path != cache_path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Already removed by a concurrent writer
+    # Write under a unique temporary name first: an interrupted run must not leave a truncated
+    # cache under the real name, and concurrent writers must not share a temporary file
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=f".{stem}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(df, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    print(f"Cache rebuilt: {cache_path}")
+    return df
+
+def load_parsed_workbook(workbook_path, parse, parser_version, use_cache=True):
+    """Returns parse(workbook_path) (a DataFrame), cached in a cache directory next to the workbook."""
+    if not use_cache:
+        return parse(workbook_path)
+    cache_dir = os.path.join(os.path.dirname(workbook_path), CACHE_DIRNAME)
+    return cached_frame(workbook_path, cache_dir, f"p{parser_version}", lambda: parse(workbook_path))